@@ -0,0 +1,254 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+# stand-ins for OctoPrint and InfluxDB, for benchmarking the plugin
+# without a printer or a database
+
+import gzip
+import io
+import json
+import logging
+import random
+import socket
+import threading
+import time
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+
+import octoprint_influxdb
+
+class FakeSettings:
+	def __init__(self, defaults, overrides={}):
+		self.values = dict(defaults)
+		self.values.update(overrides)
+
+	def get(self, path, **kwargs):
+		return self.values.get(path[0])
+
+	def _number(self, path, kind, min=None, max=None):
+		try:
+			v = kind(self.get(path))
+		except (TypeError, ValueError):
+			return None
+		if min is not None and v < min:
+			v = min
+		if max is not None and v > max:
+			v = max
+		return v
+
+	def get_int(self, path, min=None, max=None, **kwargs):
+		return self._number(path, int, min, max)
+
+	def get_float(self, path, min=None, max=None, **kwargs):
+		return self._number(path, float, min, max)
+
+	def get_boolean(self, path, **kwargs):
+		return bool(self.get(path))
+
+	def set(self, path, value, **kwargs):
+		self.values[path[0]] = value
+
+class FakePrinter:
+	# a printer that is always partway through a print, with wobbly
+	# temperatures
+	def __init__(self, tools=2):
+		self.tools = tools
+		self.start = time.time()
+
+	def is_operational(self):
+		return True
+
+	def is_printing(self):
+		return True
+
+	def get_current_temperatures(self):
+		temps = {}
+		for i in range(self.tools):
+			temps['tool{}'.format(i)] = {'actual': 210.0 + random.uniform(-1, 1), 'target': 210.0, 'offset': 0}
+		temps['bed'] = {'actual': 60.0 + random.uniform(-0.5, 0.5), 'target': 60.0, 'offset': 0}
+		return temps
+
+	def get_current_job(self):
+		return {
+			'file': {'name': 'benchy.gcode', 'display': 'benchy.gcode', 'path': 'benchy.gcode', 'origin': 'local', 'date': 1600000000, 'size': 4000000},
+			'estimatedPrintTime': 3600.0,
+			'averagePrintTime': None,
+			'lastPrintTime': None,
+			'filament': dict(('tool{}'.format(i), {'length': 5000.0, 'volume': 12.0}) for i in range(self.tools)),
+			'user': 'bench',
+		}
+
+	def get_current_data(self):
+		elapsed = time.time() - self.start
+		return {
+			'state': {'text': 'Printing'},
+			'currentZ': round(elapsed / 100.0, 2),
+			'job': self.get_current_job(),
+			'progress': {
+				'completion': min(100.0, elapsed / 36.0),
+				'filepos': int(elapsed * 1000),
+				'printTime': int(elapsed),
+				'printTimeLeft': max(0, 3600 - int(elapsed)),
+				'printTimeLeftOrigin': 'estimate',
+			},
+		}
+
+def make_plugin(data_folder, overrides={}, printer=None):
+	plugin = octoprint_influxdb.InfluxDBPlugin()
+	plugin._identifier = 'influxdb'
+	plugin._plugin_version = 'benchmark'
+	plugin._data_folder = data_folder
+	plugin._logger = logging.getLogger('octoprint.plugins.influxdb')
+	plugin._settings = FakeSettings(plugin.get_settings_defaults(), overrides)
+	plugin._printer = printer or FakePrinter()
+	return plugin
+
+class ServerStats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.requests = 0
+		self.failures = 0
+		self.points = 0
+		self.bytes = 0
+
+	def record(self, body, failed=False):
+		with self.lock:
+			self.requests += 1
+			if failed:
+				self.failures += 1
+				return
+			self.bytes += len(body)
+			self.points += body.count(b'\n') + (0 if body.endswith(b'\n') else 1)
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+class StubInfluxServer:
+	# speaks just enough of the 1.x and 2.x HTTP APIs for the plugin
+	# latency is added to every write, in seconds
+	# fail_rate is the fraction of writes that get a 500
+	# outages is a list of (start, end) times, relative to start(),
+	# where every request gets a 503
+	def __init__(self, latency=0.0, fail_rate=0.0, outages=[]):
+		self.latency = latency
+		self.fail_rate = fail_rate
+		self.outages = list(outages)
+		self.stats = ServerStats()
+		self.started = None
+		self.server = _ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+		self.thread = None
+
+	@property
+	def port(self):
+		return self.server.server_address[1]
+
+	def start(self):
+		self.started = time.time()
+		self.thread = threading.Thread(target=self.server.serve_forever, name="StubInfluxServer")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def in_outage(self):
+		now = time.time() - self.started
+		return any(start <= now < end for start, end in self.outages)
+
+	def _make_handler(self):
+		stub = self
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+
+			def log_message(self, *args):
+				pass
+
+			def reply(self, code, body=None):
+				data = b''
+				if body is not None:
+					data = json.dumps(body).encode('utf-8')
+				self.send_response(code)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(data)))
+				self.send_header('X-Influxdb-Version', 'stub')
+				self.end_headers()
+				self.wfile.write(data)
+
+			def read_body(self):
+				n = int(self.headers.get('Content-Length') or 0)
+				body = self.rfile.read(n)
+				if self.headers.get('Content-Encoding') == 'gzip':
+					body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+				return body
+
+			def do_GET(self):
+				if stub.in_outage():
+					return self.reply(503)
+				if self.path.startswith('/ping') or self.path.startswith('/health'):
+					return self.reply(204)
+				if self.path.startswith('/query'):
+					return self.reply(200, {'results': [{'statement_id': 0, 'series': [{'name': 'databases', 'columns': ['name'], 'values': [['octoprint']]}]}]})
+				if self.path.startswith('/api/v2/buckets'):
+					return self.reply(200, {'buckets': [{'id': '1', 'name': 'octoprint', 'orgID': '1', 'retentionRules': []}]})
+				self.reply(404)
+
+			do_HEAD = do_GET
+
+			def do_POST(self):
+				body = self.read_body()
+				if stub.in_outage():
+					stub.stats.record(body, failed=True)
+					return self.reply(503)
+				if self.path.startswith('/write') or self.path.startswith('/api/v2/write'):
+					if stub.latency:
+						time.sleep(stub.latency)
+					if random.random() < stub.fail_rate:
+						stub.stats.record(body, failed=True)
+						return self.reply(500, {'error': 'injected failure'})
+					stub.stats.record(body)
+					return self.reply(204)
+				if self.path.startswith('/query'):
+					return self.reply(200, {'results': [{'statement_id': 0}]})
+				self.reply(201, {})
+
+		return Handler
+
+class StubUDPListener:
+	def __init__(self):
+		self.stats = ServerStats()
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind(('127.0.0.1', 0))
+		self.sock.settimeout(0.2)
+		self.running = False
+		self.thread = None
+
+	@property
+	def port(self):
+		return self.sock.getsockname()[1]
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name="StubUDPListener")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		self.running = False
+		if self.thread:
+			self.thread.join()
+		self.sock.close()
+
+	def run(self):
+		while self.running:
+			try:
+				data = self.sock.recv(65536)
+			except socket.timeout:
+				continue
+			self.stats.record(data.rstrip(b'\n'))
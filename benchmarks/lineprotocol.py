@@ -0,0 +1,48 @@
+# coding=utf-8
+from __future__ import absolute_import, print_function
+
+# per-point CPU cost of turning a gathered temperature reading into
+# line protocol, the old way (dict + ISO time + client serializer)
+# and the new way (LineEncoder with a cached prefix)
+#
+#     PYTHONPATH=. python benchmarks/lineprotocol.py
+
+import datetime
+import timeit
+
+import influxdb.line_protocol
+
+import octoprint_influxdb.lineprotocol
+
+TAGS = {'host': 'octopi'}
+FIELDS = {
+	'tool0_actual': 210.3,
+	'tool0_target': 210.0,
+	'tool0_offset': 0,
+	'bed_actual': 60.1,
+	'bed_target': 60.0,
+	'bed_offset': 0,
+}
+
+def old():
+	point = {
+		'measurement': 'temperature',
+		'tags': TAGS.copy(),
+		'time': datetime.datetime.utcnow().isoformat() + 'Z',
+		'fields': FIELDS.copy(),
+	}
+	return influxdb.line_protocol.make_lines({'points': [point]}).encode('utf-8')
+
+encoder = octoprint_influxdb.lineprotocol.LineEncoder('us', tuple(sorted(TAGS.items())))
+
+def new():
+	return encoder.encode('temperature', (), FIELDS, encoder.timestamp())
+
+def main():
+	n = 20000
+	for name, f in [('dict + make_lines', old), ('LineEncoder', new)]:
+		best = min(timeit.repeat(f, number=n, repeat=5))
+		print("{:<20} {:8.2f} us/point".format(name, best / n * 1e6))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,127 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+# drive InfluxDBPlugin against a stub InfluxDB server and a fake
+# printer, and report emit latency, throughput and CPU per point
+#
+#     PYTHONPATH=. python benchmarks/plugin.py --api 2 --seconds 10
+#     PYTHONPATH=. python benchmarks/plugin.py --latency 0.2 --outage 3:6
+#     PYTHONPATH=. python benchmarks/plugin.py --set deadband=true
+#     PYTHONPATH=. python benchmarks/plugin.py --udp --set udp_payload=512
+
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+
+from fakes import StubInfluxServer, StubUDPListener, make_plugin
+
+def percentile(samples, p):
+	if not samples:
+		return 0.0
+	samples = sorted(samples)
+	i = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+	return samples[i]
+
+def parse_value(v):
+	lower = v.lower()
+	if lower in ('true', 'false'):
+		return lower == 'true'
+	for kind in (int, float):
+		try:
+			return kind(v)
+		except ValueError:
+			pass
+	return v
+
+def parse_outage(s):
+	start, end = s.split(':', 1)
+	return (float(start), float(end))
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--api', type=int, choices=[1, 2], default=2, help="InfluxDB API version to speak")
+	parser.add_argument('--udp', action='store_true', help="write over 1.x UDP instead of HTTP")
+	parser.add_argument('--seconds', type=float, default=10.0, help="how long to run")
+	parser.add_argument('--tick', type=float, default=0.01, help="seconds between gathers, 0 for as fast as possible")
+	parser.add_argument('--events', type=int, default=5, help="events to send per gather")
+	parser.add_argument('--latency', type=float, default=0.0, help="server latency per write, in seconds")
+	parser.add_argument('--fail-rate', type=float, default=0.0, help="fraction of writes the server rejects")
+	parser.add_argument('--outage', type=parse_outage, action='append', default=[], metavar='START:END', help="seconds into the run when the server is down")
+	parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help="override a plugin setting")
+	parser.add_argument('--verbose', action='store_true', help="show plugin logs")
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+	if args.udp:
+		args.api = 1
+		server = StubUDPListener()
+	else:
+		server = StubInfluxServer(latency=args.latency, fail_rate=args.fail_rate, outages=args.outage)
+	server.start()
+
+	overrides = dict(api_version=args.api, interval=3600, metrics_interval=0)
+	if args.udp:
+		overrides.update(host='127.0.0.1', port=server.port, udp=True)
+	elif args.api == 1:
+		overrides.update(host='127.0.0.1', port=server.port)
+	else:
+		overrides.update(url='http://127.0.0.1:{}'.format(server.port), token='bench', org='bench')
+	for item in args.set:
+		k, v = item.split('=', 1)
+		overrides[k.strip()] = parse_value(v.strip())
+
+	data_folder = tempfile.mkdtemp(prefix='influxdb-bench-')
+	plugin = make_plugin(data_folder, overrides)
+	try:
+		plugin.on_after_startup()
+		# we drive gathers ourselves
+		plugin.influx_scheduler.stop()
+
+		gather_times = []
+		event_times = []
+		cpu_start = time.process_time()
+		wall_start = time.time()
+		while time.time() - wall_start < args.seconds:
+			t = time.time()
+			plugin.influx_gather()
+			gather_times.append(time.time() - t)
+			for i in range(args.events):
+				t = time.time()
+				plugin.on_event('ZChange', {'new': 0.2 * i, 'old': 0.2 * (i - 1)})
+				event_times.append(time.time() - t)
+			if args.tick:
+				time.sleep(args.tick)
+		emit_wall = time.time() - wall_start
+
+		# write out whatever is still queued, then count it all
+		# (udp stats go away with the connection, so hold on to them)
+		packers = [d.db.udp for d in plugin.influx_destinations if getattr(d.db, 'udp', None)]
+		plugin.on_shutdown()
+		total_wall = time.time() - wall_start
+		cpu = time.process_time() - cpu_start
+	finally:
+		server.stop()
+		shutil.rmtree(data_folder, ignore_errors=True)
+
+	metrics = plugin.influx_metrics.snapshot()
+	emitted = metrics['points_emitted']
+	print("InfluxDB {}.x{}, {:.1f}s of gathering, {:.1f}s total".format(args.api, " over UDP" if args.udp else "", emit_wall, total_wall))
+	print("  influx_gather   p50 {:8.1f} us   p99 {:8.1f} us   ({} calls)".format(
+		percentile(gather_times, 50) * 1e6, percentile(gather_times, 99) * 1e6, len(gather_times)))
+	print("  on_event        p50 {:8.1f} us   p99 {:8.1f} us   ({} calls)".format(
+		percentile(event_times, 50) * 1e6, percentile(event_times, 99) * 1e6, len(event_times)))
+	print("  points emitted  {:8d}   received {:8d}   ({:.0f} points/s)".format(
+		emitted, server.stats.points, server.stats.points / total_wall))
+	print("  requests        {:8d}   failed   {:8d}   bytes {}".format(
+		server.stats.requests, server.stats.failures, server.stats.bytes))
+	if args.udp:
+		print("  datagrams       {:8d}   oversized {:7d}   dropped {}".format(
+			sum(p.datagrams for p in packers), sum(p.oversized for p in packers), sum(p.dropped for p in packers)))
+	print("  CPU             {:8.1f} us/point".format(cpu / emitted * 1e6 if emitted else 0.0))
+	print("  reconnects {reconnects}, spooled {points_spooled}, dropped {points_dropped}, write errors {write_errors}".format(**metrics))
+
+if __name__ == "__main__":
+	main()
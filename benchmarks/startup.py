@@ -0,0 +1,61 @@
+# coding=utf-8
+from __future__ import absolute_import, division, print_function
+
+# measure what loading the plugin adds to OctoPrint startup: import
+# time and peak RSS, in a fresh interpreter for every run
+#
+#     PYTHONPATH=. python benchmarks/startup.py --runs 10
+#
+# "eager" imports both client backends up front, the way the plugin
+# used to; the others load only what that api_version needs
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# OctoPrint itself is always loaded before any plugin, so it is part
+# of the baseline and not of what we measure
+CHILD = """
+import json, resource, time
+import octoprint.plugin
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+{body}
+elapsed = time.time() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps(dict(seconds=elapsed, rss_kb=rss_after - rss_before)))
+"""
+
+MODES = [
+	('lazy', "import octoprint_influxdb"),
+	('api 1', "import octoprint_influxdb\noctoprint_influxdb.destination.load_backend(1)"),
+	('api 2', "import octoprint_influxdb\noctoprint_influxdb.destination.load_backend(2)"),
+	('eager', "import octoprint_influxdb\nimport octoprint_influxdb.influxdb1\nimport octoprint_influxdb.influxdb2"),
+]
+
+def run(body):
+	out = subprocess.check_output([sys.executable, '-c', CHILD.format(body=body)], env=os.environ)
+	return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+def median(values):
+	values = sorted(values)
+	return values[len(values) // 2]
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per mode")
+	args = parser.parse_args()
+
+	print("{:8s} {:>12s} {:>12s}".format('', 'import ms', 'RSS KiB'))
+	for name, body in MODES:
+		results = [run(body) for _ in range(args.runs)]
+		print("{:8s} {:12.1f} {:12d}".format(
+			name,
+			median([r['seconds'] for r in results]) * 1000.0,
+			median([r['rss_kb'] for r in results]),
+		))
+
+if __name__ == "__main__":
+	main()
@@ -1,28 +1,38 @@
 # coding=utf-8
 from __future__ import absolute_import
 
+import collections
 import platform
 import socket
-import datetime
-import sys
-import traceback
+import os
+import threading
+import time
 
+import flask
 import octoprint.plugin
 import octoprint.util
 import monotonic
-
-import octoprint_influxdb.influxdb1
-import octoprint_influxdb.influxdb2
+from octoprint.access.permissions import Permissions
+
+import octoprint_influxdb.aggregate
+import octoprint_influxdb.cardinality
+import octoprint_influxdb.destination
+import octoprint_influxdb.filters
+import octoprint_influxdb.job
+import octoprint_influxdb.lineprotocol
+import octoprint_influxdb.metrics
+import octoprint_influxdb.process
+import octoprint_influxdb.recent
+import octoprint_influxdb.scheduler
+import octoprint_influxdb.schema
+import octoprint_influxdb.serialstats
+import octoprint_influxdb.summary
+import octoprint_influxdb.writer
 
 # control properties
 __plugin_name__ = "InfluxDB Plugin"
 __plugin_pythoncompat__ = ">=2.7, <4"
 
-# types allowed in fields
-ALLOWED_TYPES = (str, float, int, bool)
-if sys.version_info < (3, 0):
-	ALLOWED_TYPES = (unicode,) + ALLOWED_TYPES
-
 
 # On events cast theses fields with the function in value
 EVENT_CAST_FIELDS = {
@@ -35,13 +45,17 @@ HOST_NODE = "node"
 HOST_FQDN = "fqdn"
 HOST_CUSTOM = "custom"
 
-# keys that should be admin-only and not appear in logs
-SECRET_KEYS = [
-	'username',
-	'password',
-	'token',
-	'org',
-]
+# how many temperature reports to hold between gathers
+TEMPERATURE_BUFFER_SIZE = 1000
+
+# name of the destination configured by the main settings
+DEFAULT_DESTINATION = "default"
+
+# comm layer temperature keys -> names used by get_current_temperatures
+TEMPERATURE_KEYS = {
+	'B': 'bed',
+	'C': 'chamber',
+}
 
 def __plugin_load__():
 	global __plugin_implementation__
@@ -49,32 +63,121 @@ def __plugin_load__():
 
 	global __plugin_hooks__
 	__plugin_hooks__ = {
-		"octoprint.plugin.softwareupdate.check_config": __plugin_implementation__.get_update_information
+		"octoprint.plugin.softwareupdate.check_config": __plugin_implementation__.get_update_information,
+		"octoprint.comm.protocol.temperatures.received": __plugin_implementation__.influx_temperatures_received,
+		"octoprint.comm.protocol.gcode.sent": __plugin_implementation__.influx_gcode_sent,
+		"octoprint.comm.protocol.gcode.received": __plugin_implementation__.influx_gcode_received,
 	}
 
 class InfluxDBPlugin(octoprint.plugin.EventHandlerPlugin,
                      octoprint.plugin.RestartNeedingPlugin, # see issue #14
                      octoprint.plugin.SettingsPlugin,
+                     octoprint.plugin.ShutdownPlugin,
+                     octoprint.plugin.SimpleApiPlugin,
                      octoprint.plugin.StartupPlugin,
                      octoprint.plugin.TemplatePlugin):
 
 	## our logic
 
 	def __init__(self):
-		self.influx_last_exception = None
-		self.influx_exception_count = 0
-		self.influx_timer = None
-		self.influx_db = None
-		self.influx_last_reconnect = None
-		self.influx_class = None
-		self.influx_kwargs = None
-
-	@property
-	def influx_common_tags(self):
-		return dict(
-			host=self.influx_host_from_method(
-				self._settings.get(['hostmethod'])),
+		self.influx_scheduler = None
+		self.influx_collectors = {}
+		self.influx_active = True
+		# static information about the loaded file
+		self.influx_job = octoprint_influxdb.job.JobCache()
+		self.influx_destinations = []
+		# the child process doing the writing, if writer_process is on
+		self.influx_process = None
+		self.influx_prefix = ''
+		# precision -> encoder, one for each precision a destination uses
+		self.influx_encoders = {}
+		self.influx_common = ()
+		self.influx_tags_timer = None
+		self.influx_deadband = None
+		self.influx_event_filter = None
+		self.influx_aggregator = None
+		# filled by the comm thread, emptied by influx_gather
+		self.influx_temperature_hook = False
+		self.influx_temperature_buffer = collections.deque(maxlen=TEMPERATURE_BUFFER_SIZE)
+		# bumped by the comm thread for every line, if enabled
+		self.influx_serial = None
+		# the last few minutes of everything we emit, for the API
+		self.influx_recent = None
+		# running figures for the print in progress, if enabled
+		self.influx_summary = None
+		# limits tag values, and counts series
+		self.influx_cardinality = None
+		self.influx_series_logged = 0
+		self.influx_metrics = octoprint_influxdb.metrics.PluginMetrics()
+		self.influx_metrics.gauges.update(
+			queue_depth=lambda: sum(d.writer.pending() for d in self.influx_destinations if d.writer) + self.influx_process_stat('pending'),
+			points_dropped=lambda: sum(d.writer.dropped + d.dropped for d in self.influx_destinations if d.writer) + self.influx_process_stat('dropped'),
+			spool_depth=lambda: sum(d.spool.count for d in self.influx_destinations if d.spool),
+			spool_dropped=lambda: sum(d.spool.dropped for d in self.influx_destinations if d.spool),
+			destinations_down=lambda: sum(1 for d in self.influx_destinations if not d.connected()),
+			udp_datagrams=lambda: self.influx_udp_stat('datagrams'),
+			udp_oversized=lambda: self.influx_udp_stat('oversized'),
+			udp_dropped=lambda: self.influx_udp_stat('dropped'),
+			series=lambda: self.influx_cardinality.series_count() if self.influx_cardinality else 0,
 		)
+		# field names and types, learned as we go
+		self.influx_schema = octoprint_influxdb.schema.FieldSchema(
+			rename=dict((k, k + '_') for k in self.influx_name_blacklist))
+		self.influx_schema.declare('plugin_metrics', dict(
+			(k, octoprint_influxdb.schema.INTEGER) for k in self.influx_metrics.integer_fields()))
+		self.influx_schema.declare('serial', dict(
+			(k, octoprint_influxdb.schema.INTEGER) for k in octoprint_influxdb.serialstats.INTEGER_FIELDS))
+		summary_fields = dict((k, octoprint_influxdb.schema.INTEGER) for k in octoprint_influxdb.summary.INTEGER_FIELDS)
+		summary_fields['file'] = octoprint_influxdb.schema.STRING
+		self.influx_schema.declare('print_summary', summary_fields)
+		# settings changes come in on a different thread than startup
+		self.influx_lock = threading.RLock()
+
+	def influx_udp_stat(self, name):
+		total = 0
+		for dest in self.influx_destinations:
+			udp = getattr(dest.db, 'udp', None)
+			if udp:
+				total += getattr(udp, name)
+		return total
+
+	def influx_process_stat(self, name):
+		process = self.influx_process
+		if process is None:
+			return 0
+		return getattr(process, name)()
+
+	def influx_common_tags(self):
+		# this can block on DNS, so don't call it from the emit path
+		tags = dict(self.influx_parse_pairs(self._settings.get(['extra_tags'])))
+		tags['host'] = self.influx_host_from_method(self._settings.get(['hostmethod']))
+		return tuple(sorted(self.influx_rename_tags(tags).items()))
+
+	def influx_parse_pairs(self, s):
+		# "site=lab, rack=3" -> [('site', 'lab'), ('rack', '3')]
+		pairs = []
+		for item in (s or '').split(','):
+			if '=' not in item:
+				continue
+			k, v = item.split('=', 1)
+			k = k.strip()
+			v = v.strip()
+			if k and v:
+				pairs.append((k, v))
+		return pairs
+
+	def influx_refresh_tags(self, force=False):
+		try:
+			tags = self.influx_common_tags()
+		except Exception:
+			self._logger.exception("Cannot refresh common tags, keeping the old ones.")
+			return
+		if tags == self.influx_common and not force:
+			return
+		self.influx_common = tags
+		# encoders are never modified once in use, so swap in new ones
+		precisions = set(d.precision for d in self.influx_destinations)
+		self.influx_encoders = dict((p, octoprint_influxdb.lineprotocol.LineEncoder(p, tags)) for p in precisions)
 
 	def influx_host_from_method(self, method):
 		if method == HOST_NODE:
@@ -94,184 +197,509 @@ class InfluxDBPlugin(octoprint.plugin.EventHandlerPlugin,
 			# reasonable fallback
 			return platform.node()
 
-	def influx_flash_exception(self, message):
-		self.influx_exception_count += 1
-		exception = traceback.format_exc() + '\n' + message
-		if self.influx_last_exception == exception:
-			# we've already shown this, don't fill up the logs
-			self._logger.error(message)
+	def influx_connected(self):
+		# true if any destination is connected
+		# this never blocks, reconnects happen in the background
+		return any([d.connected() for d in self.influx_destinations])
+
+	def influx_spooling(self):
+		return any(d.spooling() for d in self.influx_destinations)
+
+	def influx_reconnect(self, force=False):
+		with self.influx_lock:
+			if force:
+				# settings may have changed, so restart everything that uses them
+				self.influx_prefix = self._settings.get(['prefix']) or ''
+				self.influx_start_destinations()
+				self.influx_start_encoder()
+				self.influx_start_filters()
+				self.influx_start_event_filter()
+				self.influx_start_recent()
+				self.influx_start_summary()
+				self.influx_start_cardinality()
+				self.influx_start_scheduler()
+			for dest in self.influx_destinations:
+				dest.wake(force)
+
+	def influx_start_destinations(self):
+		defaults = self.get_settings_defaults()
+		data_folder = self.get_plugin_data_folder()
+		old = dict((d.name, d) for d in self.influx_destinations)
+		specs = octoprint_influxdb.destination.destination_specs(self._settings, defaults, self._logger, DEFAULT_DESTINATION)
+
+		if self._settings.get_boolean(['writer_process']):
+			# the child process owns the real destinations, we only
+			# keep track of what it tells us about them
+			for dest in old.values():
+				dest.stop(timeout=10)
+			values = dict((k, self._settings.get([k])) for k in defaults)
+			if self.influx_process is None:
+				self.influx_process = octoprint_influxdb.process.WriterProcess(self._logger, self.influx_metrics)
+			self.influx_process.configure(values, defaults, data_folder)
+			self.influx_process.start()
+			self.influx_destinations = [
+				octoprint_influxdb.process.RemoteDestination(name, settings, defaults, self.influx_process)
+				for name, settings, _ in specs
+			]
 			return
-		self.influx_last_exception = exception
-		self._logger.exception(message)
-		# FIXME flash something to the user, probably needs JS
-
-	def influx_get_client_class(self):
-		version = self._settings.get_int(['api_version'])
-		if not version:
-			version = self.get_settings_defaults()['api_version']
-		if version == 1:
-			return octoprint_influxdb.influxdb1.InfluxDB1Client
-		elif version == 2:
-			return octoprint_influxdb.influxdb2.InfluxDB2Client
-		else:
-			# reasonable fallback
-			return octoprint_influxdb.influxdb2.InfluxDB2Client
-
-	def influx_try_connect(self, kwargs):
-		# create a safe copy we can dump out to the log, modify fields
-		kwargs = kwargs.copy()
-		kwargs_safe = kwargs.copy()
-		for k in SECRET_KEYS:
-			if k in kwargs_safe:
-				del kwargs_safe[k]
-		kwargs_log = ", ".join("{}={!r}".format(*v) for v in sorted(kwargs_safe.items()))
-		klass = self.influx_get_client_class()
-		self._logger.info("connecting: {} with {}".format(klass.__name__, kwargs_log))
-
-		dbname = 'octoprint'
-		if 'database' in kwargs:
-			dbname = kwargs.pop('database')
-
-		db = None
-		try:
-			db = klass(**kwargs)
-			db.ping()
-		except Exception:
-			# something went wrong connecting :(
-			self.influx_flash_exception('Cannot connect to InfluxDB server.')
-			if db:
-				db.close()
-			return None
-		try:
-			if db.check_database(dbname):
-				# database exists, do not create
-				self._logger.info('Using existing database `{0}`'.format(dbname))
+
+		if self.influx_process is not None:
+			# this writes out anything still queued
+			self.influx_process.stop(timeout=10)
+			self.influx_process = None
+			self.influx_metrics.remote = {}
+			old = {}
+
+		destinations = []
+		for name, settings, spool_name in specs:
+			dest = old.pop(name, None)
+			if dest:
+				dest.settings = settings
 			else:
-				# database does not exist, try to create it
-				self._logger.info('Database `{0}` does not exist, creating...'.format(dbname))
-				db.create_database(dbname)
-			# ok, now switch to the database
-			db.switch_database(dbname)
-		except Exception:
-			# something went wrong making the database
-			self.influx_flash_exception('Cannot create InfluxDB database.')
-			if db:
-				db.close()
-			return None
+				dest = octoprint_influxdb.destination.InfluxDestination(
+					name, settings, defaults, self._logger, self.influx_metrics,
+					os.path.join(data_folder, spool_name),
+				)
+			dest.start()
+			destinations.append(dest)
+		self.influx_destinations = destinations
+
+		# anything left over was removed from the settings
+		for dest in old.values():
+			dest.stop(timeout=10)
+
+	def influx_start_encoder(self):
+		self.influx_refresh_tags(force=True)
+
+		# refresh the host tag every so often in the background,
+		# in case it comes from DNS
+		if self.influx_tags_timer:
+			self.influx_tags_timer.cancel()
+			self.influx_tags_timer = None
+		ttl = self._settings.get_float(['tags_ttl'], min=0)
+		if ttl:
+			self.influx_tags_timer = octoprint.util.RepeatedTimer(ttl, self.influx_refresh_tags)
+			self.influx_tags_timer.start()
+
+	def influx_start_filters(self):
+		if not self._settings.get_boolean(['deadband']):
+			self.influx_deadband = None
+			return
 
-		# *normally* we'd reset this here, but actually we will
-		# wait for the first successful write in influx_emit
-		#self.influx_exception_count = 0
-		return db
+		defaults = self.get_settings_defaults()
+		absolute = self._settings.get_float(['deadband_absolute'], min=0)
+		relative = self._settings.get_float(['deadband_relative'], min=0)
+		heartbeat = self._settings.get_float(['deadband_heartbeat'], min=0)
+		if absolute is None:
+			absolute = defaults['deadband_absolute']
+		if relative is None:
+			relative = defaults['deadband_relative']
+		if heartbeat is None:
+			heartbeat = defaults['deadband_heartbeat']
+		overrides = {}
+		for k, v in self.influx_parse_pairs(self._settings.get(['deadband_overrides'])):
+			try:
+				overrides[k] = float(v)
+			except ValueError:
+				self._logger.warning("Ignoring bad deadband override for {}: {!r}".format(k, v))
+
+		self.influx_deadband = octoprint_influxdb.filters.Deadband(
+			absolute=absolute,
+			relative=relative,
+			heartbeat=heartbeat,
+			overrides=overrides,
+		)
 
-	def influx_connected(self):
-		if self.influx_db:
-			return True
-		self.influx_reconnect()
-		return bool(self.influx_db)
+	def influx_start_event_filter(self):
+		def parse_list(key):
+			return [p.strip() for p in (self._settings.get([key]) or '').split(',') if p.strip()]
+		allow = parse_list('event_allow')
+		deny = parse_list('event_deny')
+		defaults = self.get_settings_defaults()
+		rate = self._settings.get_float(['event_rate'], min=0)
+		burst = self._settings.get_float(['event_burst'], min=1)
+		if rate is None:
+			rate = defaults['event_rate']
+		if burst is None:
+			burst = defaults['event_burst']
+		overrides = {}
+		for k, v in self.influx_parse_pairs(self._settings.get(['event_rate_overrides'])):
+			try:
+				overrides[k] = float(v)
+			except ValueError:
+				self._logger.warning("Ignoring bad event rate for {}: {!r}".format(k, v))
 
-	def influx_backoff(self):
-		# first try 1s, then after 2s, then after 3s...
-		# but never wait longer than 10 minutes
-		return min(10 * 60, self.influx_exception_count)
+		if not (allow or deny or rate or overrides):
+			# write every event, as it happens
+			self.influx_event_filter = None
+			return
 
-	def influx_reconnect(self, force=False):
-		now = monotonic.monotonic()
-		if not (force or self.influx_last_reconnect is None or self.influx_last_reconnect + self.influx_backoff() < now):
-			# don't attempt to reconnect more than once per 10s
+		self.influx_event_filter = octoprint_influxdb.filters.EventFilter(
+			allow=allow,
+			deny=deny,
+			rate=rate,
+			burst=burst,
+			overrides=overrides,
+		)
+
+	def influx_start_recent(self):
+		defaults = self.get_settings_defaults()
+		window = self._settings.get_float(['recent_window'], min=0)
+		capacity = self._settings.get_int(['recent_size'], min=1)
+		if window is None:
+			window = defaults['recent_window']
+		if not capacity:
+			capacity = defaults['recent_size']
+		if not window:
+			self.influx_recent = None
 			return
-		self.influx_last_reconnect = now
-		# stop the old timer, if we need to
-		if self.influx_timer:
-			self.influx_timer.cancel()
-			self.influx_timer = None
-
-		klass = self.influx_get_client_class()
-		kwargs = klass.get_kwargs(self._settings)
-
-		if self.influx_db is None or kwargs != self.influx_kwargs or klass is not self.influx_class:
-			self.influx_db = self.influx_try_connect(kwargs)
-			if self.influx_db:
-				self.influx_kwargs = kwargs
-				self.influx_class = klass
-				self.influx_prefix = self._settings.get(['prefix']) or ''
-				self.influx_retention_policy = self._settings.get(['retention_policy']) or None
+		recent = self.influx_recent
+		if recent is not None and recent.capacity == capacity:
+			# keep what we have, it's still good
+			recent.window = window
+			return
+		self.influx_recent = octoprint_influxdb.recent.RecentPoints(window, capacity)
+
+	def influx_cardinality_path(self):
+		return os.path.join(self.get_plugin_data_folder(), 'tag_values.json')
+
+	def influx_start_cardinality(self):
+		limits = {}
+		for k, v in self.influx_parse_pairs(self._settings.get(['tag_limits'])):
+			limit, _, policy = v.partition(':')
+			policy = policy.strip() or octoprint_influxdb.cardinality.POLICY_FIELD
+			try:
+				limit = int(limit)
+			except ValueError:
+				limit = None
+			if limit is None or limit < 0 or policy not in octoprint_influxdb.cardinality.POLICIES:
+				self._logger.warning("Ignoring bad tag limit for {}: {!r}".format(k, v))
+				continue
+			limits[self.influx_rename_tags({k: None}).popitem()[0]] = (limit, policy)
+
+		old = self.influx_cardinality
+		guard = octoprint_influxdb.cardinality.CardinalityGuard(limits)
+		path = self.influx_cardinality_path()
+		if old is not None:
+			self.influx_save_cardinality()
+			# limits may change, but the series we've written haven't
+			guard.series = old.series
+		guard.load(path)
+		self.influx_cardinality = guard
+
+	def influx_save_cardinality(self):
+		guard = self.influx_cardinality
+		if guard is None:
+			return
+		try:
+			guard.save(self.influx_cardinality_path())
+		except Exception:
+			self._logger.exception("Cannot save tag values.")
+
+	def influx_start_summary(self):
+		if not self._settings.get_boolean(['print_summary']):
+			self.influx_summary = None
+		elif self.influx_summary is None:
+			# keep the old one, so saving settings mid-print doesn't
+			# lose the print so far
+			self.influx_summary = octoprint_influxdb.summary.PrintSummary()
+
+	def influx_summary_temperatures(self, t, fields):
+		summary = self.influx_summary
+		if summary is not None:
+			summary.temperatures(t, fields)
+
+	def influx_filter(self, measurement, fields):
+		# drop fields that haven't changed enough to be worth writing
+		deadband = self.influx_deadband
+		if deadband is None:
+			return fields
+		filtered = deadband.filter(measurement, fields, monotonic.monotonic())
+		self.influx_metrics.count('fields_filtered', len(fields) - len(filtered))
+		if not filtered:
+			self.influx_metrics.count('points_filtered')
+		return filtered
+
+	def influx_start_scheduler(self):
+		# stop the old scheduler, if we need to
+		if self.influx_scheduler:
+			self.influx_scheduler.stop()
+			self.influx_scheduler = None
+
+		defaults = self.get_settings_defaults()
+		def get_interval(key, fallback):
+			v = self._settings.get_float([key], min=0)
+			if v is None:
+				v = defaults[key]
+			return v or fallback
+
+		# temperature goes at interval while printing or heating, and
+		# at idle_interval otherwise
+		interval = get_interval('interval', defaults['interval'])
+		idle_interval = get_interval('idle_interval', interval)
+		progress_interval = get_interval('progress_interval', interval)
+		metrics_interval = get_interval('metrics_interval', None)
+		sample_interval = get_interval('sample_interval', None)
+
+		# optionally, sample temperatures faster than we report them
+		self.influx_aggregator = None
+		self.influx_temperature_hook = self._settings.get_boolean(['temperature_hook'])
+		self.influx_temperature_buffer.clear()
+		sampling = False
+		if sample_interval and sample_interval < interval:
+			self.influx_aggregator = octoprint_influxdb.aggregate.WindowAggregator(
+				stddev=self._settings.get_boolean(['sample_stddev']))
+			# with the comm hook, every report is already a sample
+			sampling = not self.influx_temperature_hook
+
+		if self._settings.get_boolean(['serial_metrics']):
+			if self.influx_serial is None:
+				self.influx_serial = octoprint_influxdb.serialstats.SerialStats()
+		else:
+			self.influx_serial = None
+
+		# assume we're busy until the first state check says otherwise
+		self.influx_active = True
+
+		# every collector runs on this one thread, and keeps running
+		# while disconnected, so we keep spooling points
+		scheduler = octoprint_influxdb.scheduler.Scheduler(self._logger)
+		collectors = self.influx_collectors = dict(
+			temperature=self.influx_collector(self.influx_gather_temperature),
+			progress=self.influx_collector(self.influx_gather_progress),
+			job=self.influx_collector(self.influx_gather_job),
+			metrics=self.influx_collector(self.influx_gather_metrics, printer=False),
+			serial=self.influx_collector(self.influx_gather_serial),
+		)
+		scheduler.add('temperature', collectors['temperature'], lambda: interval if self.influx_active else idle_interval)
+		scheduler.add('progress', collectors['progress'], lambda: progress_interval)
+		# the job only changes on events, this just picks up the file
+		# that was already loaded when we started
+		scheduler.add('job', collectors['job'], lambda: None)
+		scheduler.add('metrics', collectors['metrics'], lambda: metrics_interval)
+		if self.influx_serial is not None:
+			# the serial link is as busy as the heaters, roughly
+			scheduler.add('serial', collectors['serial'], lambda: interval if self.influx_active else idle_interval)
+		if idle_interval != interval:
+			scheduler.add('state', self.influx_check_state, lambda: interval)
+		if sampling:
+			scheduler.add('sample', self.influx_sample, lambda: sample_interval)
+		if self.influx_event_filter is not None:
+			# write out rate-limited events once their bucket refills
+			collectors['events'] = self.influx_collector(self.influx_gather_events, printer=False)
+			scheduler.add('events', collectors['events'], lambda: 1.0)
+		self.influx_job.clear()
+		scheduler.trigger('job')
+		scheduler.start()
+		self.influx_scheduler = scheduler
+
+	def influx_collector(self, gather, printer=True):
+		# wrap up a gather function for the scheduler
+		def run():
+			# if we're not connected to a database, and not saving
+			# points for later, do nothing
+			if not self.influx_connected() and not self.influx_spooling():
+				return
+			# if we're not connected to a printer, there's nothing to gather
+			if printer and not self._printer.is_operational():
+				return
+			start = monotonic.monotonic()
+			gather()
+			self.influx_metrics.observe('gather_duration', monotonic.monotonic() - start)
+		return run
+
+	def influx_printer_active(self):
+		if not self._printer.is_operational():
+			return False
+		if self._printer.is_printing():
+			return True
+		temps = self._printer.get_current_temperatures() or {}
+		return any(v.get('target') for v in temps.values() if isinstance(v, dict))
+
+	def influx_check_state(self):
+		# this is cheap, it only looks at what OctoPrint already knows
+		active = self.influx_printer_active()
+		if active != self.influx_active:
+			self.influx_active = active
+			self.influx_scheduler.reschedule('temperature')
+
+	def influx_temperature_fields(self, temps):
+		fields = {}
+		for sensor in temps:
+			for subfield in temps[sensor]:
+				fields[sensor + '_' + subfield] = temps[sensor][subfield]
+		return fields
+
+	def influx_temperatures_received(self, comm, parsed_temperatures, *args, **kwargs):
+		# this runs on the comm thread for every temperature report,
+		# so do as little as possible
+		if self.influx_temperature_hook:
+			self.influx_temperature_buffer.append((time.time(), parsed_temperatures))
+		return parsed_temperatures
+
+	def influx_gcode_sent(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
+		# runs on the comm thread for every line, only bump counters
+		serial = self.influx_serial
+		if serial is not None:
+			serial.sent(cmd, comm_instance.isPrinting())
+
+	def influx_gcode_received(self, comm_instance, line, *args, **kwargs):
+		serial = self.influx_serial
+		if serial is not None:
+			serial.received(line)
+		return line
+
+	def influx_received_fields(self, parsed_temperatures):
+		fields = {}
+		for key, value in parsed_temperatures.items():
+			if key.startswith('T') and key[1:].isdigit():
+				sensor = 'tool' + key[1:]
+			else:
+				sensor = TEMPERATURE_KEYS.get(key, key.lower())
+			actual, target = value
+			if actual is not None:
+				fields[sensor + '_actual'] = actual
+			if target is not None:
+				fields[sensor + '_target'] = target
+		return fields
+
+	def influx_gather_received(self):
+		# emit everything the comm hook collected since the last gather
+		buf = self.influx_temperature_buffer
+		aggregator = self.influx_aggregator
+		while True:
+			try:
+				t, parsed_temperatures = buf.popleft()
+			except IndexError:
+				break
+			fields = self.influx_received_fields(parsed_temperatures)
+			self.influx_summary_temperatures(t, fields)
+			if aggregator is not None:
+				aggregator.add(fields)
+				continue
+			fields = self.influx_filter('temperature', fields)
+			if fields:
+				self.influx_emit('temperature', fields, timestamp=t)
 
-		# start a new timer
-		if self.influx_db:
-			interval = self._settings.get_float(['interval'], min=0)
-			if not interval:
-				interval = self.get_settings_defaults()['interval']
-			self.influx_timer = octoprint.util.RepeatedTimer(interval, self.influx_gather)
-			self.influx_timer.start()
+		if aggregator is not None:
+			fields = self.influx_filter('temperature', aggregator.emit())
+			if fields:
+				self.influx_emit('temperature', fields)
+
+	def influx_sample(self):
+		aggregator = self.influx_aggregator
+		if aggregator is None or not self._printer.is_operational():
+			return
+		temps = self._printer.get_current_temperatures()
+		if temps:
+			fields = self.influx_temperature_fields(temps)
+			self.influx_summary_temperatures(time.time(), fields)
+			aggregator.add(fields)
 
 	# what are bad names for tags that we should change
 	influx_name_blacklist = set([
 		'time',
 	])
 
-	def influx_emit(self, measurement, fields, extra_tags={}):
-		tags = self.influx_common_tags.copy()
-		if extra_tags:
-			tags.update(extra_tags)
-
-		fields = fields.copy()
-
+	def influx_rename_tags(self, tags):
 		# make sure we don't use any keywords as names
 		for k in list(tags.keys()):
 			if k in self.influx_name_blacklist:
 				tags[k + '_'] = tags[k]
 				del tags[k]
-		for k, v in list(fields.items()):
-			# also, make sure we give influx only data it can handle
-			if not isinstance(v, ALLOWED_TYPES):
-				del fields[k]
-				continue
-			if k in self.influx_name_blacklist:
-				fields[k + '_'] = fields[k]
-				del fields[k]
+		return tags
+
+	def influx_emit(self, measurement, fields, extra_tags={}, timestamp=None):
+		# timestamp is in seconds since the epoch, default now
+		# common tags are already baked into the encoders
+		tags = ()
+		guard = self.influx_cardinality
+		if extra_tags:
+			extra_tags = self.influx_rename_tags(dict(extra_tags))
+			if guard is not None:
+				# values past their key's limit become fields, hashes or
+				# "other", so they don't each make a new series
+				fields, filled = guard.apply(extra_tags, fields)
+				for k in filled:
+					self._logger.warning("Tag {!r} has reached its limit of values, new ones will use the {!r} policy.".format(k, guard.limits[k][1]))
+			tags = tuple(sorted(extra_tags.items()))
+		if guard is not None:
+			guard.count(self.influx_prefix + measurement, tags)
+
+		# make sure we don't use any keywords as names, and give
+		# influx only data it can handle, with the same type each time
+		fields = self.influx_schema.apply(measurement, fields)
 
 		# empty fields are an issue for influx, so
 		if not fields:
 			fields['_dummy'] = 0
 
-		# python doesn't put the Z at the end
-		# because python cannot into timezones until Python 3
-		time = datetime.datetime.utcnow().isoformat() + 'Z'
-		point = {
-			'measurement': self.influx_prefix + measurement,
-			'tags': tags,
-			'time': time,
-			'fields': fields,
-		}
-		try:
-			self.influx_db.write_points([point], retention_policy=self.influx_retention_policy)
-			self.influx_exception_count = 0
-		except Exception:
-			# we were dropped! try to reconnect
-			self.influx_flash_exception("Disconnected from InfluxDB. Attempting to reconnect.")
-			if self.influx_db:
-				self.influx_db.close()
-			self.influx_db = None
-			self.influx_reconnect()
-
-	def influx_gather(self):
-		# if we're not connected to a database, do nothing
-		if not self.influx_connected():
+		if timestamp is None:
+			# the same time for every destination
+			timestamp = time.time()
+		recent = self.influx_recent
+		if recent is not None:
+			recent.add(measurement, tags, fields, timestamp)
+		encoders = self.influx_encoders
+		# encode once per precision, not once per destination
+		points = {}
+		start = monotonic.monotonic()
+		for precision, encoder in encoders.items():
+			points[precision] = encoder.encode(self.influx_prefix + measurement, tags, fields, encoder.timestamp(timestamp))
+		self.influx_metrics.observe('encode_time', monotonic.monotonic() - start)
+		if not any(points.values()):
 			return
-		# if we're not connected to a printer, do nothing
-		if not self._printer.is_operational():
+		self.influx_metrics.count('points_emitted')
+
+		process = self.influx_process
+		if process is not None:
+			# one copy per precision goes to the child, which hands
+			# it out to its destinations
+			process.put(points)
 			return
 
-		temps = self._printer.get_current_temperatures()
-		if temps:
-			fields = {}
-			for sensor in temps:
-				for subfield in temps[sensor]:
-					fields[sensor + '_' + subfield] = temps[sensor][subfield]
+		# each destination's writer thread batches these up and does
+		# the actual write
+		for dest in self.influx_destinations:
+			point = points.get(dest.precision)
+			if point is not None:
+				dest.put(point)
 
-			self.influx_emit('temperature', fields)
+	def influx_gather(self):
+		# gather the periodic measurements right now, off schedule
+		for name in ['temperature', 'progress']:
+			self.influx_collectors[name]()
+
+	def influx_gather_metrics(self):
+		self.influx_emit('plugin_metrics', self.influx_metrics.snapshot(reset=True))
+		guard = self.influx_cardinality
+		if guard is not None:
+			count = guard.series_count()
+			if count != self.influx_series_logged:
+				self.influx_series_logged = count
+				self._logger.info("Written to {} series since startup.".format(count))
+			self.influx_save_cardinality()
+
+	def influx_gather_temperature(self):
+		if self.influx_temperature_hook:
+			self.influx_gather_received()
+		else:
+			aggregator = self.influx_aggregator
+			if aggregator is not None:
+				# one summary of everything sampled since the last gather
+				fields = aggregator.emit()
+			else:
+				fields = None
+				temps = self._printer.get_current_temperatures()
+				if temps:
+					fields = self.influx_temperature_fields(temps)
+					self.influx_summary_temperatures(time.time(), fields)
+			if fields:
+				fields = self.influx_filter('temperature', fields)
+				if fields:
+					self.influx_emit('temperature', fields)
 
+	def influx_gather_progress(self):
 		data = self._printer.get_current_data()
 		def add_to(d, k, x):
 			if x:
@@ -295,73 +723,160 @@ class InfluxDBPlugin(octoprint.plugin.EventHandlerPlugin,
 			add_to(fields, 'print_time', progress.get('printTime'))
 			add_to(fields, 'print_time_left', progress.get('printTimeLeft'))
 			add_to(fields, 'print_time_left_origin', progress.get('printTimeLeftOrigin'))
+			summary = self.influx_summary
+			if summary is not None:
+				summary.progress(fields)
+			fields = self.influx_filter('progress', fields)
 			if fields:
 				self.influx_emit('progress', fields)
 
-		if data and data.get('job'):
-			job = data.get('job')
-			if job.get('file', {}).get('name'):
-				# a file is loaded...
-				filename = job['file']['name']
-				if job.get('filament'):
-					filaments = job.get('filament')
-					for tool, filval in filaments.items():
-						fields = { }
-						tags = {}
-						add_to(fields, 'length', filval.get('length'))
-						add_to(fields, 'volume', filval.get('volume'))
-						add_to(tags, 'filename', filename)
-						add_to(tags, 'tool', tool)
-						if fields:
-							self.influx_emit('filament', fields, tags)
+	def influx_gather_serial(self):
+		serial = self.influx_serial
+		if serial is None:
+			return
+		fields = serial.emit()
+		if fields:
+			self.influx_emit('serial', fields)
+
+	def influx_gather_job(self):
+		if self.influx_job.update(self._printer.get_current_job()):
+			self.influx_emit_filament()
+
+	def influx_emit_filament(self):
+		_, filament = self.influx_job.snapshot()
+		for tags, fields in filament:
+			self.influx_emit('filament', fields, tags)
+
+	def influx_gather_events(self):
+		for event, payload, count in self.influx_event_filter.flush(monotonic.monotonic()):
+			self.influx_emit_event(event, payload, count)
+
+	def influx_emit_event(self, event, payload, count=1):
+		fields = {}
+		for field, value in payload.items():
+			if field in EVENT_CAST_FIELDS:
+				value = EVENT_CAST_FIELDS[field](value)
+			fields[field] = value
+		if count > 1:
+			# this point stands in for a burst of events
+			fields['count'] = count
+		self.influx_emit('events', fields, extra_tags={'type': event})
 
 	##~~ EventHandlerPlugin mixin
 
 	def on_event(self, event, payload):
-		# if we're not connected, do nothing
-		if not self.influx_connected():
+		scheduler = self.influx_scheduler
+		if scheduler:
+			if event in ['PrinterStateChanged', 'PrintStarted']:
+				# don't wait for the next state check to speed up
+				scheduler.trigger('state')
+		if event == 'Disconnected' and self.influx_serial is not None:
+			self.influx_serial.reset_pending()
+
+		# keep track of the loaded job, even if we can't write it now
+		job_changed = False
+		if event == 'FileDeselected':
+			job_changed = self.influx_job.clear()
+		elif event in ['FileSelected', 'MetadataAnalysisFinished', 'PrintStarted']:
+			job_changed = self.influx_job.update(self._printer.get_current_job())
+
+		# the summary is written even if the event itself is filtered
+		summary = self.influx_summary
+		summary_fields = None
+		if summary is not None:
+			now = time.time()
+			if event == 'PrintStarted':
+				summary.begin(now, self.influx_job.snapshot()[0])
+			elif event == 'PrintPaused':
+				summary.pause(now)
+			elif event == 'PrintResumed':
+				summary.resume(now)
+			elif event in ['PrintDone', 'PrintFailed']:
+				summary_fields = summary.finish(now, (payload or {}).get('time'))
+
+		# if we're not connected, and not saving points for later, do nothing
+		if not self.influx_connected() and not self.influx_spooling():
 			return
 
 		if not payload:
 			payload = {}
 
-		for field in payload:
-			if field in EVENT_CAST_FIELDS:
-				payload[field] = EVENT_CAST_FIELDS[field](payload[field])
-		self.influx_emit('events', payload, extra_tags={'type': event})
-
-		# state changes happen on events, so...
-		if event not in ['PrinterStateChanged', 'FileSelected', 'FileDeselected', 'MetadataAnalysisFinished']:
+		event_filter = self.influx_event_filter
+		if event_filter is None:
+			self.influx_emit_event(event, payload)
+		else:
+			count = event_filter.admit(event, payload, monotonic.monotonic())
+			if count:
+				self.influx_emit_event(event, payload, count)
+
+		if summary_fields:
+			result = 'done' if event == 'PrintDone' else payload.get('reason') or 'failed'
+			self.influx_emit('print_summary', summary_fields, {'result': result})
+
+		# state changes happen on events, and job points are only
+		# written when something about the job changed
+		if job_changed:
+			self.influx_emit_filament()
+		elif event != 'PrinterStateChanged':
 			# state hasn't changed
 			return
 
-		job = self._printer.get_current_job()
 		data = self._printer.get_current_data()
-		def add_to(d, k, x):
-			if x:
-				d[k] = x
-
-		fields = {}
-		add_to(fields, 'state', data.get('state', {}).get('text'))
-		if job.get('file', {}).get('name'):
-			# a file is loaded...
-			jobfile = job['file']
-			add_to(fields, 'average_print_time', job.get('averagePrintTime'))
-			add_to(fields, 'estimated_print_time', job.get('estimatedPrintTime'))
-			filaments = job.get('filament')
-			if not filaments:
-				filaments = {}
-			for filname, filval in filaments.items():
-				add_to(fields, 'filament_' + filname + '_length', filval.get('length'))
-				add_to(fields, 'filament_' + filname + '_volume', filval.get('volume'))
-			add_to(fields, 'file_date', jobfile.get('date'))
-			add_to(fields, 'file', jobfile.get('display'))
-			add_to(fields, 'file_size', jobfile.get('size'))
-			add_to(fields, 'last_print_time', job.get('lastPrintTime'))
-			add_to(fields, 'user', job.get('user'))
+		job_fields, _ = self.influx_job.snapshot()
+		fields = dict(job_fields)
+		state = data.get('state', {}).get('text')
+		if state:
+			fields['state'] = state
 		if fields:
 			self.influx_emit('state', fields)
 
+	##~~ SimpleApiPlugin mixin
+
+	def get_api_commands(self):
+		return {}
+
+	def on_api_get(self, request):
+		if not Permissions.STATUS.can():
+			flask.abort(403)
+		if 'recent' in request.values:
+			return self.influx_api_recent(request.values)
+		return flask.jsonify(metrics=self.influx_metrics.snapshot())
+
+	def influx_api_recent(self, args):
+		# ?recent lists the series we have
+		# ?recent=temperature&fields=bed_actual,tool0_actual&start=-300&step=10
+		# returns points for one measurement, optionally only some fields,
+		# between start and end (epoch seconds, or negative for seconds
+		# ago), averaged into step-second buckets
+		recent = self.influx_recent
+		if recent is None:
+			flask.abort(404, description="Recent points are disabled.")
+		measurement = args.get('recent')
+		if not measurement:
+			return flask.jsonify(series=recent.names())
+
+		def get_float(key):
+			v = args.get(key)
+			if v is None or v == '':
+				return None
+			try:
+				return float(v)
+			except ValueError:
+				flask.abort(400, description="{} must be a number".format(key))
+		fields = [f.strip() for f in (args.get('fields') or '').split(',') if f.strip()]
+		step = get_float('step')
+		if step is not None and step <= 0:
+			flask.abort(400, description="step must be positive")
+		series = recent.query(
+			time.time(),
+			measurement=measurement,
+			fields=fields or None,
+			start=get_float('start'),
+			end=get_float('end'),
+			step=step,
+		)
+		return flask.jsonify(series=series)
+
 	##~~ SettingsPlugin mixin
 
 	def get_settings_version(self):
@@ -377,27 +892,81 @@ class InfluxDBPlugin(octoprint.plugin.EventHandlerPlugin,
 			prefix='',
 			hostmethod=HOST_NODE,
 			hostcustom='octoprint',
+			extra_tags='',
+			tags_ttl=3600,
 			username=None,
 			password=None,
 			interval=1,
+			idle_interval=0,
+			progress_interval=0,
+			metrics_interval=60,
+			recent_window=600,
+			recent_size=600,
+			temperature_hook=False,
+			serial_metrics=False,
+			print_summary=True,
+			sample_interval=0,
+			sample_stddev=False,
+			deadband=False,
+			deadband_absolute=0.1,
+			deadband_relative=0.0,
+			deadband_heartbeat=60,
+			deadband_overrides='',
+			event_allow='',
+			event_deny='',
+			event_rate=0.0,
+			event_burst=5,
+			event_rate_overrides='',
+			tag_limits='',
+			timeout=10,
+			health_interval=30,
+			backoff_max=600,
+			pool_size=4,
+			gzip=False,
+			precision='us',
+			queue_size=10000,
+			batch_size=500,
+			batch_max_age=5,
+			queue_overflow=octoprint_influxdb.writer.OVERFLOW_DROP_OLDEST,
+			spool=True,
+			spool_max_size=64,
+			spool_replay_rate=1000,
+			spool_replay_batch=5000,
+			writer_process=False,
+			rollups=False,
+			rollup_name='rollup',
+			rollup_interval=60,
+			rollup_retention=365,
+			raw_retention=0,
 
 			# 1.x only
 			host=None,
 			port=None,
 			authenticate=False,
 			udp=False,
+			udp_payload=1400,
 			ssl=False,
 			retention_policy=None,
 
+			# line protocol files only
+			file_path='',
+			file_compression='gzip',
+			file_rotate_size=64,
+			file_rotate_interval=3600,
+
 			# 2.x only
 			url='http://localhost:8086',
 			use_username_password=False,
 			token=None,
 			org=None,
+
+			# more destinations, each a dict of settings that override
+			# the ones above, plus a name
+			destinations=[],
 		)
 
 	def get_settings_restricted_paths(self):
-		return dict(admin=[[k] for k in SECRET_KEYS])
+		return dict(admin=[[k] for k in octoprint_influxdb.destination.SECRET_KEYS] + [['destinations']])
 
 	def on_settings_migrate(self, target, current):
 		if current is None:
@@ -418,6 +987,23 @@ class InfluxDBPlugin(octoprint.plugin.EventHandlerPlugin,
 		self.influx_reconnect(True)
 		return r
 
+	##~~ ShutdownPlugin mixin
+
+	def on_shutdown(self):
+		if self.influx_scheduler:
+			self.influx_scheduler.stop()
+			self.influx_scheduler = None
+		if self.influx_tags_timer:
+			self.influx_tags_timer.cancel()
+			self.influx_tags_timer = None
+		for dest in self.influx_destinations:
+			# this writes out anything still queued
+			dest.stop(timeout=10)
+		if self.influx_process is not None:
+			self.influx_process.stop(timeout=10)
+			self.influx_process = None
+		self.influx_save_cardinality()
+
 	##~~ StartupPlugin mixin
 
 	def on_after_startup(self):
@@ -0,0 +1,71 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import math
+import numbers
+import threading
+
+class FieldStats:
+	# running statistics for one field, in constant space
+	__slots__ = ('count', 'min', 'max', 'mean', 'm2', 'last')
+
+	def __init__(self):
+		self.count = 0
+		self.min = None
+		self.max = None
+		self.mean = 0.0
+		self.m2 = 0.0
+		self.last = None
+
+	def add(self, v):
+		self.last = v
+		if isinstance(v, bool) or not isinstance(v, numbers.Real):
+			# we can only keep the last value of these
+			return
+		self.count += 1
+		if self.min is None or v < self.min:
+			self.min = v
+		if self.max is None or v > self.max:
+			self.max = v
+		# Welford's online mean and variance
+		delta = v - self.mean
+		self.mean += delta / self.count
+		self.m2 += delta * (v - self.mean)
+
+	def stddev(self):
+		if self.count < 2:
+			return 0.0
+		return math.sqrt(self.m2 / (self.count - 1))
+
+class WindowAggregator:
+	def __init__(self, stddev=False):
+		self.stddev = stddev
+		self.lock = threading.Lock()
+		self.fields = {}
+
+	def add(self, fields):
+		with self.lock:
+			for k, v in fields.items():
+				stats = self.fields.get(k)
+				if stats is None:
+					stats = self.fields[k] = FieldStats()
+				stats.add(v)
+
+	def emit(self):
+		# returns the summary fields for this window, and starts a new one
+		# each field keeps its name for the last value, and gains
+		# _min, _max, _mean (and maybe _stddev) versions
+		with self.lock:
+			fields = self.fields
+			self.fields = {}
+		out = {}
+		for k, stats in fields.items():
+			out[k] = stats.last
+			if not stats.count:
+				continue
+			out[k + '_min'] = stats.min
+			out[k + '_max'] = stats.max
+			out[k + '_mean'] = stats.mean
+			if self.stddev:
+				out[k + '_stddev'] = stats.stddev()
+		return out
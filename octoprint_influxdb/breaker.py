@@ -0,0 +1,62 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import random
+
+import monotonic
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+	# after a failure, stay open (no attempts) for an exponentially
+	# growing, jittered delay, then let one attempt through
+	# jitter keeps a fleet of printers from retrying in lockstep after
+	# their shared server comes back
+	def __init__(self, base=1.0, maximum=600.0, jitter=0.5):
+		self.base = base
+		self.maximum = maximum
+		self.jitter = jitter
+		self.failures = 0
+		self.state = CLOSED
+		self.retry_at = None
+
+	def configure(self, base, maximum):
+		self.base = base
+		self.maximum = maximum
+
+	def allow(self):
+		# true if an attempt may be made right now
+		if self.state == OPEN:
+			if monotonic.monotonic() < self.retry_at:
+				return False
+			self.state = HALF_OPEN
+		return True
+
+	def remaining(self):
+		# seconds until allow() will say yes
+		if self.state != OPEN:
+			return 0.0
+		return max(0.0, self.retry_at - monotonic.monotonic())
+
+	def delay(self):
+		# base, 2 * base, 4 * base, ... up to maximum, then shaved
+		# down by up to jitter of itself
+		exponent = min(self.failures - 1, 32)
+		delay = min(self.maximum, self.base * (2 ** exponent))
+		return delay * (1.0 - random.uniform(0, self.jitter))
+
+	def success(self):
+		self.failures = 0
+		self.state = CLOSED
+		self.retry_at = None
+
+	def failure(self):
+		self.failures += 1
+		self.state = OPEN
+		self.retry_at = monotonic.monotonic() + self.delay()
+
+	def reset(self):
+		# settings changed, so the next attempt may as well go now
+		self.success()
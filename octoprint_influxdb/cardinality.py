@@ -0,0 +1,119 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import collections
+import io
+import json
+import os
+import threading
+import zlib
+
+from octoprint_influxdb.lineprotocol import to_text
+
+# what to do with a tag value once its key is at its limit
+POLICY_FIELD = 'field'
+POLICY_HASH = 'hash'
+POLICY_OTHER = 'other'
+POLICIES = [POLICY_FIELD, POLICY_HASH, POLICY_OTHER]
+
+# the tag value used by POLICY_OTHER
+OTHER = 'other'
+
+# POLICY_HASH spreads values over this many tag values
+HASH_BUCKETS = 64
+
+# the most series to count, in case the guard isn't enough
+MAX_SERIES = 100000
+
+class CardinalityGuard:
+	# keeps tags with endless possible values, like file names, from
+	# making endless series. each limited tag key keeps the first limit
+	# values it sees as real tags, for good; new values past that get
+	# the key's policy. nothing is evicted, since a value we let go of
+	# would make a new series when it came back.
+	def __init__(self, limits):
+		# limits is tag key -> (limit, policy)
+		self.limits = dict(limits)
+		self.lock = threading.Lock()
+		# tag key -> value -> None, in the order we first saw them
+		self.seen = {}
+		# tag keys we've already warned about
+		self.full = set()
+		# (measurement, tags) we've written, for counting
+		self.series = set()
+		self.dirty = False
+
+	def load(self, path):
+		# values seen before a restart, so they still count
+		try:
+			with io.open(path, 'r', encoding='utf-8') as f:
+				saved = json.load(f)
+		except (IOError, OSError, ValueError):
+			return
+		with self.lock:
+			for key, values in saved.items():
+				if key not in self.limits or not isinstance(values, list):
+					continue
+				limit = self.limits[key][0]
+				# saved oldest first, so keep the head
+				index = self.seen[key] = collections.OrderedDict()
+				for v in values[:limit]:
+					index[v] = None
+
+	def save(self, path):
+		with self.lock:
+			if not self.dirty:
+				return
+			saved = dict((k, list(index.keys())) for k, index in self.seen.items())
+			self.dirty = False
+		tmp = path + '.tmp'
+		with io.open(tmp, 'w', encoding='utf-8') as f:
+			f.write(u'' + json.dumps(saved, sort_keys=True, indent=1))
+		# rename won't replace a file on windows, on python 2
+		getattr(os, 'replace', os.rename)(tmp, path)
+
+	def apply(self, tags, fields):
+		# tags is a dict, changed in place; returns fields, which is
+		# a new dict if anything was moved into it
+		# also returns a list of keys that just became full
+		filled = []
+		with self.lock:
+			for key, v in list(tags.items()):
+				limit = self.limits.get(key)
+				if limit is None:
+					continue
+				limit, policy = limit
+				index = self.seen.get(key)
+				if index is None:
+					index = self.seen[key] = collections.OrderedDict()
+				if v in index:
+					continue
+				if len(index) < limit:
+					index[v] = None
+					self.dirty = True
+					continue
+
+				if key not in self.full:
+					self.full.add(key)
+					filled.append(key)
+				if policy == POLICY_HASH:
+					tags[key] = '{}-{:02x}'.format(POLICY_HASH, zlib.crc32(to_text(v).encode('utf-8')) % HASH_BUCKETS)
+				elif policy == POLICY_OTHER:
+					tags[key] = OTHER
+				else:
+					del tags[key]
+					if key not in fields:
+						fields = dict(fields)
+						fields[key] = v
+		return fields, filled
+
+	def count(self, measurement, tags):
+		# tags is the sorted tuple the encoders use
+		series = (measurement, tags)
+		if series in self.series or len(self.series) >= MAX_SERIES:
+			return
+		with self.lock:
+			self.series.add(series)
+
+	def series_count(self):
+		return len(self.series)
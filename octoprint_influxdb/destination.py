@@ -0,0 +1,606 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import importlib
+import os
+import threading
+import traceback
+
+import monotonic
+
+import octoprint_influxdb.breaker
+import octoprint_influxdb.lineprotocol
+import octoprint_influxdb.rollup
+import octoprint_influxdb.spool
+import octoprint_influxdb.writer
+
+# api_version -> (module, class) for each client backend
+# these are imported only when used, since each one pulls in a whole
+# client library and nobody needs both
+BACKENDS = {
+	1: ('octoprint_influxdb.influxdb1', 'InfluxDB1Client'),
+	2: ('octoprint_influxdb.influxdb2', 'InfluxDB2Client'),
+	'file': ('octoprint_influxdb.filesink', 'FileSinkClient'),
+}
+
+def backend_key(version):
+	if version not in BACKENDS:
+		try:
+			version = int(version)
+		except (TypeError, ValueError):
+			pass
+	if version not in BACKENDS:
+		# reasonable fallback
+		version = 2
+	return version
+
+def load_backend(version):
+	module, name = BACKENDS[backend_key(version)]
+	return getattr(importlib.import_module(module), name)
+
+# keys that should be admin-only and not appear in logs
+SECRET_KEYS = [
+	'username',
+	'password',
+	'token',
+	'org',
+]
+
+# settings that extra destinations never inherit from the main
+# settings, so credentials for one server are never sent to another
+CONNECTION_KEYS = [
+	'api_version',
+	'host',
+	'port',
+	'authenticate',
+	'udp',
+	'ssl',
+	'verify_ssl',
+	'url',
+	'use_username_password',
+	'username',
+	'password',
+	'token',
+	'org',
+	'database',
+	'retention_policy',
+	'file_path',
+]
+
+def _status(e):
+	# 1.x errors carry .code, 2.x errors carry .status
+	for attr in ('code', 'status'):
+		code = getattr(e, attr, None)
+		if isinstance(code, int):
+			return code
+	return None
+
+def _not_found(e):
+	return _status(e) == 404
+
+# client errors that still say nothing about the data, so the points
+# are kept and we reconnect: auth, missing database, timeouts and
+# rate limits
+RETRY_STATUSES = [401, 403, 404, 408, 429]
+
+# the request was too big, which says nothing about the points either,
+# so the batch is written again in halves
+TOO_LARGE = 413
+
+def _rejected(e):
+	# the server refused the data itself, say a field type conflict,
+	# and sending it again will only be refused again
+	code = _status(e)
+	return code is not None and 400 <= code < 500 and code not in RETRY_STATUSES
+
+def _convert(v, kind, min=None, max=None):
+	if v is None:
+		return None
+	try:
+		v = kind(v)
+	except (TypeError, ValueError):
+		return None
+	if min is not None and v < min:
+		v = min
+	if max is not None and v > max:
+		v = max
+	return v
+
+def client_version(settings, defaults):
+	version = settings.get(['api_version'])
+	if not version:
+		version = defaults['api_version']
+	return backend_key(version)
+
+def client_class(settings, defaults):
+	return load_backend(client_version(settings, defaults))
+
+def client_precision(settings, defaults):
+	# worked out from settings alone, without loading the backend, so
+	# the writer process's parent never imports a client library
+	if client_version(settings, defaults) == 1 and settings.get_boolean(['udp']):
+		# the UDP listener expects nanoseconds unless configured otherwise
+		precision = 'ns'
+	else:
+		precision = settings.get(['precision'])
+	if precision not in octoprint_influxdb.lineprotocol.PRECISIONS:
+		precision = defaults['precision']
+	return precision
+
+class DestinationSettings:
+	# looks like plugin settings, for get_kwargs and friends, but
+	# reads from a destination's own settings block first
+	def __init__(self, settings, overrides, defaults):
+		self.settings = settings
+		self.overrides = overrides
+		self.defaults = defaults
+
+	def local(self, path):
+		# returns (found, value)
+		k = path[0]
+		if k in self.overrides:
+			return (True, self.overrides[k])
+		if k in CONNECTION_KEYS:
+			return (True, self.defaults.get(k))
+		return (False, None)
+
+	def get(self, path, **kwargs):
+		found, v = self.local(path)
+		if found:
+			return v
+		return self.settings.get(path, **kwargs)
+
+	def get_int(self, path, min=None, max=None, **kwargs):
+		found, v = self.local(path)
+		if found:
+			return _convert(v, int, min, max)
+		return self.settings.get_int(path, min=min, max=max, **kwargs)
+
+	def get_float(self, path, min=None, max=None, **kwargs):
+		found, v = self.local(path)
+		if found:
+			return _convert(v, float, min, max)
+		return self.settings.get_float(path, min=min, max=max, **kwargs)
+
+	def get_boolean(self, path, **kwargs):
+		found, v = self.local(path)
+		if found:
+			if hasattr(v, 'lower'):
+				return v.lower() in ('true', 'yes', 'y', '1', 'on')
+			return bool(v)
+		return self.settings.get_boolean(path, **kwargs)
+
+class StaticSettings:
+	# looks like plugin settings, but reads from a plain dict of values,
+	# for use where the real settings aren't available
+	def __init__(self, values):
+		self.values = values
+
+	def get(self, path, **kwargs):
+		return self.values.get(path[0])
+
+	def get_int(self, path, min=None, max=None, **kwargs):
+		return _convert(self.get(path), int, min, max)
+
+	def get_float(self, path, min=None, max=None, **kwargs):
+		return _convert(self.get(path), float, min, max)
+
+	def get_boolean(self, path, **kwargs):
+		v = self.get(path)
+		if hasattr(v, 'lower'):
+			return v.lower() in ('true', 'yes', 'y', '1', 'on')
+		return bool(v)
+
+def destination_specs(settings, defaults, logger, default_name):
+	# returns a (name, settings, spool file name) for each destination
+	# the main settings are always the first destination
+	specs = [(default_name, settings, 'spool.sqlite')]
+	names = set([default_name])
+	for i, overrides in enumerate(settings.get(['destinations']) or []):
+		name = overrides.get('name') or 'destination{}'.format(i + 1)
+		if name in names:
+			logger.warning("Ignoring destination with duplicate name {!r}".format(name))
+			continue
+		names.add(name)
+		spool_name = 'spool-{}.sqlite'.format(''.join(c if c.isalnum() else '_' for c in name))
+		specs.append((name, DestinationSettings(settings, overrides, defaults), spool_name))
+	return specs
+
+class InfluxDestination:
+	def __init__(self, name, settings, defaults, logger, metrics, spool_path):
+		self.name = name
+		self.settings = settings
+		self.defaults = defaults
+		self.logger = logger
+		self.metrics = metrics
+		self.spool_path = spool_path
+
+		self.db = None
+		self.klass = None
+		self.kwargs = None
+		self.retention_policy = None
+		self.precision = None
+		self.last_exception = None
+		self.writer = None
+		self.spool = None
+		self.replayer = None
+		# points lost because we couldn't write them and had no spool
+		self.dropped = 0
+
+		# the manager thread owns connecting, reconnecting and health
+		# checks; everyone else only reads self.db and wakes it up
+		self.manager = None
+		self.running = False
+		self.wakeup = threading.Event()
+		self.force_reconnect = False
+		self.health_interval = None
+		self.last_health = None
+		self.breaker = octoprint_influxdb.breaker.CircuitBreaker()
+		# connection kwargs we've already found or created a database for
+		self.verified = set()
+		self.lock = threading.RLock()
+
+	def log(self, message):
+		return "{}: {}".format(self.name, message)
+
+	def flash_exception(self, message):
+		exception = traceback.format_exc() + '\n' + message
+		if self.last_exception == exception:
+			# we've already shown this, don't fill up the logs
+			self.logger.error(self.log(message))
+			return
+		self.last_exception = exception
+		self.logger.exception(self.log(message))
+		# FIXME flash something to the user, probably needs JS
+
+	def get_client_class(self):
+		return client_class(self.settings, self.defaults)
+
+	def start(self):
+		# (re)read settings, and restart everything that uses them
+		self.retention_policy = self.settings.get(['retention_policy']) or None
+		self.precision = client_precision(self.settings, self.defaults)
+		self.start_writer()
+		self.start_spool()
+		self.start_manager()
+
+	def stop(self, timeout=None):
+		if self.replayer:
+			self.replayer.stop()
+		if self.writer:
+			# write out anything still queued
+			self.writer.stop(timeout=timeout)
+		with self.lock:
+			spool = self.spool
+			self.spool = None
+		if spool:
+			spool.close()
+		self.running = False
+		self.wakeup.set()
+		if self.manager:
+			self.manager.join(timeout)
+			self.manager = None
+		with self.lock:
+			if self.db:
+				self.db.close()
+				self.db = None
+
+	def start_writer(self):
+		queue_size = self.settings.get_int(['queue_size'], min=1)
+		batch_size = self.settings.get_int(['batch_size'], min=1)
+		max_age = self.settings.get_float(['batch_max_age'], min=0)
+		overflow = self.settings.get(['queue_overflow'])
+		if not queue_size:
+			queue_size = self.defaults['queue_size']
+		if not batch_size:
+			batch_size = self.defaults['batch_size']
+		if max_age is None:
+			max_age = self.defaults['batch_max_age']
+
+		if self.writer:
+			self.writer.configure(queue_size, batch_size, max_age, overflow)
+		else:
+			self.writer = octoprint_influxdb.writer.InfluxWriter(
+				self.write_batch, self.logger,
+				queue_size=queue_size,
+				batch_size=batch_size,
+				max_age=max_age,
+				overflow=overflow,
+			)
+		self.writer.start()
+
+	def start_spool(self):
+		if self.replayer:
+			self.replayer.stop()
+			self.replayer = None
+
+		spool = None
+		if self.settings.get_boolean(['spool']):
+			max_size = self.settings.get_float(['spool_max_size'], min=0)
+			if not max_size:
+				max_size = self.defaults['spool_max_size']
+			spool = self.open_spool(int(max_size * 1024 * 1024))
+
+		# the writer thread may be spooling a batch right now
+		with self.lock:
+			old = self.spool
+			self.spool = spool
+		if old is not None and old is not spool:
+			old.close()
+		if spool is None:
+			return
+
+		rate = self.settings.get_int(['spool_replay_rate'], min=0)
+		batch_size = self.settings.get_int(['spool_replay_batch'], min=1)
+		if rate is None:
+			rate = self.defaults['spool_replay_rate']
+		if not batch_size:
+			batch_size = self.defaults['spool_replay_batch']
+		self.replayer = octoprint_influxdb.spool.SpoolReplayer(
+			spool, self.write_points, self.logger,
+			rate=rate,
+			batch_size=batch_size,
+		)
+		self.replayer.start()
+		if self.db:
+			self.replayer.wake()
+
+	def open_spool(self, max_size):
+		# keeps the spool we have if nothing about it changed, so saving
+		# settings doesn't reopen it under the writer
+		spool = self.spool
+		if spool is not None and spool.path == self.spool_path and spool.max_size == max_size:
+			return spool
+		try:
+			return octoprint_influxdb.spool.InfluxSpool(self.spool_path, max_size, self.logger)
+		except Exception:
+			self.logger.exception(self.log("Cannot open spool at {}, points will be dropped while disconnected.".format(self.spool_path)))
+			return None
+
+	def start_manager(self):
+		health_interval = self.settings.get_float(['health_interval'], min=0)
+		backoff_max = self.settings.get_float(['backoff_max'], min=1)
+		if health_interval is None:
+			health_interval = self.defaults['health_interval']
+		if not backoff_max:
+			backoff_max = self.defaults['backoff_max']
+		self.health_interval = health_interval
+		self.breaker.configure(1.0, backoff_max)
+
+		if self.manager is None:
+			self.running = True
+			self.manager = threading.Thread(target=self.run_manager, name="InfluxConnection")
+			self.manager.daemon = True
+			self.manager.start()
+
+	def spooling(self):
+		return self.spool is not None
+
+	def try_connect(self, klass, kwargs):
+		# create a safe copy we can dump out to the log, modify fields
+		kwargs = kwargs.copy()
+		kwargs_safe = kwargs.copy()
+		for k in SECRET_KEYS:
+			if k in kwargs_safe:
+				del kwargs_safe[k]
+		kwargs_log = ", ".join("{}={!r}".format(*v) for v in sorted(kwargs_safe.items()))
+		self.logger.info(self.log("connecting: {} with {}".format(klass.__name__, kwargs_log)))
+
+		verified = (klass.__name__, tuple(sorted(kwargs.items())))
+		dbname = 'octoprint'
+		if 'database' in kwargs:
+			dbname = kwargs.pop('database')
+
+		db = None
+		try:
+			db = klass(**kwargs)
+			db.ping()
+		except Exception:
+			# something went wrong connecting :(
+			self.flash_exception('Cannot connect to InfluxDB server.')
+			if db:
+				db.close()
+			return None
+		try:
+			if verified in self.verified:
+				# we've seen it before, no need to list every database again
+				pass
+			elif db.check_database(dbname):
+				# database exists, do not create
+				self.logger.info(self.log('Using existing database `{0}`'.format(dbname)))
+			else:
+				# database does not exist, try to create it
+				self.logger.info(self.log('Database `{0}` does not exist, creating...'.format(dbname)))
+				db.create_database(dbname)
+			self.verified.add(verified)
+			# ok, now switch to the database
+			db.switch_database(dbname)
+		except Exception:
+			# something went wrong making the database
+			self.flash_exception('Cannot create InfluxDB database.')
+			if db:
+				db.close()
+			return None
+
+		self.provision(db, klass, kwargs, dbname)
+		return db
+
+	def provision(self, db, klass, kwargs, dbname):
+		# set up rollups on the server, if asked, once per server and
+		# rollup settings
+		spec = octoprint_influxdb.rollup.rollup_spec(self.settings, self.defaults)
+		cache = octoprint_influxdb.rollup.RollupCache(os.path.join(os.path.dirname(self.spool_path), 'rollups.json'))
+		if spec is None:
+			cache.mark(self.name, None)
+			return
+		provision_rollups = getattr(db, 'provision_rollups', None)
+		if provision_rollups is None:
+			return
+		key = cache.key(klass.__name__, dict(kwargs, database=dbname), spec)
+		if cache.done(self.name, key):
+			return
+		try:
+			if not provision_rollups(dbname, spec):
+				self.logger.warning(self.log("Rollups can't be set up over this connection."))
+				return
+		except Exception:
+			# we can still write without them
+			self.flash_exception('Cannot set up rollups.')
+			return
+		self.logger.info(self.log("Set up rollups `{}` every {}s.".format(spec['name'], spec['interval'])))
+		cache.mark(self.name, key)
+
+	def connected(self):
+		# never blocks, the manager thread does all the connecting
+		return self.db is not None
+
+	def wake(self, force=False):
+		# ask the manager thread to look at the connection now
+		# forced wakes reconnect right away, since settings have changed
+		if force:
+			with self.lock:
+				self.force_reconnect = True
+				self.breaker.reset()
+		self.wakeup.set()
+
+	def run_manager(self):
+		while self.running:
+			# clear first, so wakes that happen while we work aren't lost
+			self.wakeup.clear()
+			try:
+				timeout = self.manage()
+			except Exception:
+				self.logger.exception(self.log("Unexpected error while managing connection."))
+				timeout = self.breaker.maximum
+			self.wakeup.wait(timeout)
+
+	def manage(self):
+		# one pass of the manager thread
+		# returns how long to sleep, or None to sleep until woken
+		with self.lock:
+			force = self.force_reconnect
+			self.force_reconnect = False
+
+		if force or self.db is None:
+			if not (force or self.breaker.allow()):
+				return self.breaker.remaining()
+			self.reconnect()
+		elif self.health_interval and self.last_health + self.health_interval <= monotonic.monotonic():
+			self.health_check()
+
+		if self.db is None:
+			return self.breaker.remaining()
+		if not self.health_interval:
+			return None
+		return max(0.0, self.last_health + self.health_interval - monotonic.monotonic())
+
+	def reconnect(self):
+		# only called on the manager thread
+		klass = self.get_client_class()
+		kwargs = klass.get_kwargs(self.settings)
+		if getattr(klass, 'uses_data_folder', False):
+			kwargs['data_folder'] = os.path.dirname(self.spool_path)
+		if self.db is not None and kwargs == self.kwargs and klass is self.klass:
+			# settings changed, but not the ones we connect with,
+			# though maybe the rollup ones
+			kwargs = kwargs.copy()
+			self.provision(self.db, klass, kwargs, kwargs.pop('database', 'octoprint'))
+			return
+
+		self.drop(self.db)
+		self.metrics.count('reconnects')
+		db = self.try_connect(klass, kwargs)
+		if db is None:
+			self.breaker.failure()
+			return
+
+		# the breaker closes on the first successful write, not here,
+		# so a server that accepts connections but not writes still
+		# gets backed off from
+		with self.lock:
+			self.db = db
+			self.kwargs = kwargs
+			self.klass = klass
+		self.last_health = monotonic.monotonic()
+		# write out anything we saved up while disconnected
+		if self.replayer:
+			self.replayer.wake()
+
+	def health_check(self):
+		db = self.db
+		self.last_health = monotonic.monotonic()
+		try:
+			db.ping()
+		except Exception:
+			self.metrics.count('health_failures')
+			self.flash_exception("InfluxDB health check failed. Attempting to reconnect.")
+			self.drop(db)
+			self.breaker.failure()
+
+	def drop(self, db):
+		# forget about a connection, if it's still the current one
+		if db is None:
+			return
+		with self.lock:
+			if self.db is db:
+				self.db = None
+		db.close()
+
+	def put(self, point):
+		self.writer.put(point)
+
+	def write_points(self, points, precision):
+		# returns True if we're done with the points, because they were
+		# written or rejected, or False if they should be kept
+		db = self.db
+		if not db:
+			return False
+		try:
+			start = monotonic.monotonic()
+			db.write_points(points, retention_policy=self.retention_policy, precision=precision)
+			now = monotonic.monotonic()
+			self.metrics.observe('write_latency', now - start)
+			self.metrics.count('points_written', len(points))
+			self.metrics.count('bytes_written', sum(len(p) for p in points))
+			# a write is as good as a health check
+			self.last_health = now
+			self.breaker.success()
+			return True
+		except Exception as e:
+			self.metrics.count('write_errors')
+			if _status(e) == TOO_LARGE and len(points) > 1:
+				# if the second half fails the whole batch is kept, but
+				# writing the first half again only overwrites it
+				self.logger.debug(self.log("{} points were too large for one request, splitting them".format(len(points))))
+				half = len(points) // 2
+				return self.write_points(points[:half], precision) and self.write_points(points[half:], precision)
+			if _rejected(e):
+				# the connection is fine, the data isn't
+				self.metrics.count('points_rejected', len(points))
+				self.logger.error(self.log("InfluxDB rejected {} points, dropping them: {}".format(len(points), e)))
+				self.logger.debug(self.log("First rejected point: {!r}".format(points[0])))
+				return True
+			if _not_found(e):
+				# the database went away, so check it again next time
+				self.verified.clear()
+			# we were dropped! try to reconnect
+			self.flash_exception("Disconnected from InfluxDB. Attempting to reconnect.")
+			self.drop(db)
+			self.breaker.failure()
+			self.wakeup.set()
+			return False
+
+	def write_batch(self, points):
+		# called on the writer thread
+		precision = self.precision
+		if self.write_points(points, precision):
+			return
+		# keep these around until we can write them
+		# the lock keeps start_spool from closing the spool under us
+		with self.lock:
+			spool = self.spool
+			if spool is not None:
+				spool.append(points, precision)
+				self.metrics.count('points_spooled', len(points))
+			else:
+				self.dropped += len(points)
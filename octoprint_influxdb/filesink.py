@@ -0,0 +1,168 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import gzip
+import io
+import math
+import os
+import threading
+import time
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+
+EXTENSIONS = {
+	COMPRESSION_NONE: '.lp',
+	COMPRESSION_GZIP: '.lp.gz',
+	COMPRESSION_ZSTD: '.lp.zst',
+}
+
+# files being written have this on the end, and lose it when they are
+# complete and safe to import
+PARTIAL = '.part'
+
+# how much compressed output to buffer before going to disk
+BUFFER_SIZE = 256 * 1024
+
+class FileSinkClient:
+	# writes line protocol to rotating, compressed files instead of a
+	# server, for loading later with `influx write`
+	# files are named <database>-<start time>-<precision>.lp.gz
+
+	# ask the destination for its data folder, for relative paths
+	uses_data_folder = True
+
+	@classmethod
+	def get_kwargs(cls, settings):
+		kwargs = {}
+		kwargs['path'] = settings.get(['file_path']) or 'lines'
+		kwargs['compression'] = settings.get(['file_compression']) or COMPRESSION_GZIP
+		rotate_size = settings.get_float(['file_rotate_size'], min=0)
+		if rotate_size:
+			kwargs['rotate_size'] = int(rotate_size * 1024 * 1024)
+		rotate_interval = settings.get_float(['file_rotate_interval'], min=0)
+		if rotate_interval:
+			kwargs['rotate_interval'] = rotate_interval
+		database = settings.get(['database'])
+		if database:
+			kwargs['database'] = database
+		return kwargs
+
+	def __init__(self, path, data_folder=None, compression=COMPRESSION_GZIP, rotate_size=64 * 1024 * 1024, rotate_interval=3600):
+		if data_folder:
+			path = os.path.join(data_folder, path)
+		if compression not in EXTENSIONS:
+			raise ValueError("unknown compression {!r}".format(compression))
+		if compression == COMPRESSION_ZSTD:
+			# optional, only needed if asked for
+			import zstandard
+			self.zstandard = zstandard
+		self.path = path
+		self.compression = compression
+		self.rotate_size = rotate_size
+		self.rotate_interval = rotate_interval
+		self.database = 'octoprint'
+		self.lock = threading.Lock()
+
+		# the file we're writing now
+		self.raw = None
+		self.stream = None
+		self.filename = None
+		self.precision = None
+		self.rotate_at = None
+
+	def ping(self):
+		# this is called every so often, so it's a good time to finish
+		# up a file that's past its time, even if nothing is written
+		with self.lock:
+			if self.due():
+				self.finish()
+		if not os.path.isdir(self.path):
+			try:
+				os.makedirs(self.path)
+			except OSError:
+				if not os.path.isdir(self.path):
+					raise
+		if not os.access(self.path, os.W_OK):
+			raise IOError("cannot write to {}".format(self.path))
+
+	def check_database(self, dbname):
+		return True
+
+	def create_database(self, dbname):
+		pass
+
+	def switch_database(self, dbname):
+		self.database = dbname
+
+	def open(self, precision):
+		now = time.time()
+		stamp = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now))
+		name = '{}-{}-{}{}'.format(self.database, stamp, precision, EXTENSIONS[self.compression])
+		filename = os.path.join(self.path, name)
+		n = 1
+		while os.path.exists(filename) or os.path.exists(filename + PARTIAL):
+			# more than one file a second, somehow
+			name = '{}-{}.{}-{}{}'.format(self.database, stamp, n, precision, EXTENSIONS[self.compression])
+			filename = os.path.join(self.path, name)
+			n += 1
+
+		raw = io.open(filename + PARTIAL, 'wb', buffering=BUFFER_SIZE)
+		if self.compression == COMPRESSION_GZIP:
+			stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+		elif self.compression == COMPRESSION_ZSTD:
+			stream = self.zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+		else:
+			stream = raw
+		self.raw = raw
+		self.stream = stream
+		self.filename = filename
+		self.precision = precision
+		self.rotate_at = None
+		if self.rotate_interval:
+			# line up with the clock, so files cover tidy periods
+			self.rotate_at = (math.floor(now / self.rotate_interval) + 1) * self.rotate_interval
+
+	def finish(self):
+		# flush, sync and rename the current file, if any
+		if self.stream is None:
+			return
+		stream, raw, filename = self.stream, self.raw, self.filename
+		self.stream = self.raw = self.filename = None
+		try:
+			if self.compression == COMPRESSION_ZSTD:
+				stream.flush(self.zstandard.FLUSH_FRAME)
+			elif stream is not raw:
+				# writes the gzip trailer, but leaves raw open
+				stream.close()
+			raw.flush()
+			os.fsync(raw.fileno())
+		finally:
+			raw.close()
+		os.rename(filename + PARTIAL, filename)
+
+	def due(self):
+		if self.stream is None:
+			return False
+		if self.rotate_at is not None and time.time() >= self.rotate_at:
+			return True
+		if self.rotate_size and self.raw.tell() >= self.rotate_size:
+			return True
+		return False
+
+	def write_points(self, points, retention_policy=None, precision='us'):
+		# points is a list of encoded line protocol bytes
+		with self.lock:
+			if self.stream is not None and (precision != self.precision or self.due()):
+				self.finish()
+			if self.stream is None:
+				self.open(precision)
+			self.stream.write(b'\n'.join(points) + b'\n')
+
+	def close(self):
+		with self.lock:
+			try:
+				self.finish()
+			except Exception:
+				pass
@@ -0,0 +1,130 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import fnmatch
+import numbers
+import threading
+
+class Deadband:
+	def __init__(self, absolute=0.0, relative=0.0, heartbeat=60.0, overrides={}):
+		# a numeric field is only written when it moves more than
+		# absolute, or more than relative * its last written value.
+		# every field is written at least once per heartbeat seconds.
+		# overrides maps field names to their own absolute threshold
+		self.absolute = absolute
+		self.relative = relative
+		self.heartbeat = heartbeat
+		self.overrides = dict(overrides)
+		# (measurement, field) -> (last written value, when)
+		self.last = {}
+
+	def changed(self, field, old, new):
+		if isinstance(new, bool) or isinstance(old, bool):
+			return old != new
+		if not (isinstance(new, numbers.Real) and isinstance(old, numbers.Real)):
+			return old != new
+		threshold = self.overrides.get(field)
+		if threshold is None:
+			threshold = max(self.absolute, self.relative * abs(old))
+		if threshold <= 0:
+			return old != new
+		return abs(new - old) >= threshold
+
+	def filter(self, measurement, fields, now):
+		# returns the fields worth writing, which may be empty
+		out = {}
+		for k, v in fields.items():
+			key = (measurement, k)
+			last = self.last.get(key)
+			if last is not None:
+				old, when = last
+				if now - when < self.heartbeat and not self.changed(k, old, v):
+					continue
+			self.last[key] = (v, now)
+			out[k] = v
+		return out
+
+	def reset(self):
+		self.last.clear()
+
+class EventFilter:
+	def __init__(self, allow=[], deny=[], rate=0.0, burst=1.0, overrides={}):
+		# allow and deny are lists of event names or glob patterns, an
+		# empty allow list allows everything, and deny always wins.
+		# each event type may be written rate times per second, with
+		# bursts of up to burst; overrides maps event names to their
+		# own rate. events over the limit are merged into the next
+		# point of their type, with a count field.
+		self.allow = list(allow)
+		self.deny = list(deny)
+		self.rate = rate
+		self.burst = max(1.0, burst)
+		self.overrides = dict(overrides)
+		self.lock = threading.Lock()
+		# event -> allowed, filled in as we see new event types
+		self.decisions = {}
+		# event -> [tokens, last refill]
+		self.buckets = {}
+		# event -> [payload, count] for events we held back
+		self.pending = {}
+
+	def allowed(self, event):
+		decision = self.decisions.get(event)
+		if decision is None:
+			decision = self.decide(event)
+			self.decisions[event] = decision
+		return decision
+
+	def decide(self, event):
+		if any(fnmatch.fnmatchcase(event, p) for p in self.deny):
+			return False
+		if not self.allow:
+			return True
+		return any(fnmatch.fnmatchcase(event, p) for p in self.allow)
+
+	def take(self, event, now):
+		# true if the event's bucket has a token for us
+		rate = self.overrides.get(event, self.rate)
+		if not rate or rate <= 0:
+			return True
+		bucket = self.buckets.get(event)
+		if bucket is None:
+			bucket = self.buckets[event] = [self.burst, now]
+		else:
+			bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * rate)
+			bucket[1] = now
+		if bucket[0] < 1.0:
+			return False
+		bucket[0] -= 1.0
+		return True
+
+	def admit(self, event, payload, now):
+		# returns how many events the point for this one stands for,
+		# or 0 if it should not be written now
+		if not self.allowed(event):
+			return 0
+		with self.lock:
+			held = self.pending.get(event)
+			if not self.take(event, now):
+				# hold on to the latest one, to be written later
+				if held is None:
+					self.pending[event] = [payload, 1]
+				else:
+					held[0] = payload
+					held[1] += 1
+				return 0
+			if held is None:
+				return 1
+			del self.pending[event]
+			return held[1] + 1
+
+	def flush(self, now):
+		# returns [(event, payload, count)] for held events that can
+		# be written now
+		out = []
+		with self.lock:
+			for event in list(self.pending.keys()):
+				if self.take(event, now):
+					payload, count = self.pending.pop(event)
+					out.append((event, payload, count))
+		return out
@@ -1,5 +1,19 @@
 import influxdb
 
+import octoprint_influxdb.rollup
+import octoprint_influxdb.udp
+
+# plugin precision names -> 1.x precision names
+PRECISIONS = {
+	's': 's',
+	'ms': 'ms',
+	'us': 'u',
+	'ns': 'n',
+}
+
+def quote(name):
+	return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
 class InfluxDB1Client:
 	@classmethod
 	def get_kwargs(cls, settings):
@@ -19,20 +33,43 @@ class InfluxDB1Client:
 		kwargs['ssl'] = settings.get_boolean(['ssl'])
 		if kwargs['ssl']:
 			kwargs['verify_ssl'] = settings.get_boolean(['verify_ssl'])
+		add_arg_if_exists('timeout', ['timeout'], settings.get_float)
+		add_arg_if_exists('pool_size', ['pool_size'], settings.get_int)
+		kwargs['gzip'] = settings.get_boolean(['gzip'])
 		kwargs['use_udp'] = settings.get_boolean(['udp'])
-		if kwargs['use_udp'] and 'port' in kwargs:
-			kwargs['udp_port'] = kwargs['port']
-			del kwargs['port']
+		if kwargs['use_udp']:
+			if 'port' in kwargs:
+				kwargs['udp_port'] = kwargs['port']
+				del kwargs['port']
+			add_arg_if_exists('udp_payload', ['udp_payload'], settings.get_int)
 
 		return kwargs
 
 	def __init__(self, **kwargs):
+		udp_payload = kwargs.pop('udp_payload', octoprint_influxdb.udp.DEFAULT_PAYLOAD)
+		# the client keeps one requests session, so connections are
+		# kept alive and reused between writes
 		self.client = influxdb.InfluxDBClient(**kwargs)
+		self.use_udp = kwargs.get('use_udp', False)
+		self.database = kwargs.get('database')
+		self.udp = None
+		if self.use_udp:
+			self.udp = octoprint_influxdb.udp.UDPPacker(
+				kwargs.get('host', 'localhost'),
+				kwargs.get('udp_port', 4444),
+				udp_payload,
+			)
 
 	def ping(self):
+		if self.use_udp:
+			# there's nothing to ping, UDP writes never touch HTTP
+			return
 		self.client.ping()
 
 	def check_database(self, dbname):
+		if self.use_udp:
+			# the UDP listener picks the database, on the server
+			return True
 		for dbmeta in self.client.get_list_database():
 			if dbmeta['name'] == dbname:
 				return True
@@ -43,11 +80,70 @@ class InfluxDB1Client:
 
 	def switch_database(self, dbname):
 		self.client.switch_database(dbname)
+		self.database = dbname
+
+	def provision_rollups(self, dbname, rollup):
+		# a retention policy to hold the rollups, and a continuous query
+		# for each measurement to fill it. returns False if we can't.
+		if self.use_udp:
+			return False
+		name = rollup['name']
+		duration = octoprint_influxdb.rollup.duration
+
+		policies = self.client.get_list_retention_policies(dbname)
+		if name in [p['name'] for p in policies]:
+			self.client.alter_retention_policy(name, dbname, duration=duration(rollup['retention']))
+		else:
+			self.client.create_retention_policy(name, duration(rollup['retention']), 1, dbname)
+		if rollup['raw_retention']:
+			raw = rollup['retention_policy']
+			if not raw:
+				raw = [p['name'] for p in policies if p['default']][0]
+			self.client.alter_retention_policy(raw, dbname, duration=duration(rollup['raw_retention']))
+
+		# continuous queries can't be changed, so the interval is in
+		# the name, and ones with an old interval are dropped
+		interval = duration(rollup['interval'])
+		ours = 'octoprint_{}_'.format(name)
+		wanted = {}
+		for measurement in rollup['measurements']:
+			source = quote(measurement)
+			if rollup['retention_policy']:
+				source = quote(rollup['retention_policy']) + '.' + source
+			select = 'SELECT mean(*) INTO {}.{}.:MEASUREMENT FROM {} GROUP BY time({}), *'.format(
+				quote(dbname), quote(name), source, interval)
+			wanted['{}{}_{}'.format(ours, measurement, interval)] = select
+
+		existing = []
+		for db in self.client.get_list_continuous_queries():
+			for cq in db.get(dbname, []):
+				existing.append(cq['name'])
+		for cq in existing:
+			if cq.startswith(ours) and cq not in wanted:
+				self.client.drop_continuous_query(cq, dbname)
+		for cq, select in sorted(wanted.items()):
+			if cq not in existing:
+				self.client.create_continuous_query(cq, select, dbname)
+		return True
+
+	def write_points(self, points, retention_policy=None, precision='us'):
+		# points is a list of encoded line protocol bytes
+		if self.use_udp:
+			# precision for UDP is set on the server, see client_precision
+			self.udp.send(points)
+			return
 
-	def write_points(self, points, retention_policy=None):
-		self.client.write_points(points, retention_policy=retention_policy)
+		params = {
+			'db': self.database,
+			'precision': PRECISIONS.get(precision, 'u'),
+		}
+		if retention_policy:
+			params['rp'] = retention_policy
+		self.client.request('write', 'POST', params=params, data=b'\n'.join(points) + b'\n', expected_response_code=204)
 
 	def close(self):
+		if self.udp:
+			self.udp.close()
 		try:
 			self.client.close()
 		except Exception:
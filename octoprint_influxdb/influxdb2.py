@@ -1,6 +1,24 @@
 import influxdb_client
 import influxdb_client.client.write_api
 
+import octoprint_influxdb.rollup
+
+ROLLUP_TASK = u'''import "types"
+
+option task = {{name: {name}, every: {interval}, offset: 15s}}
+
+from(bucket: {source})
+	|> range(start: -task.every)
+	|> filter(fn: (r) => {measurements})
+	|> filter(fn: (r) => types.isNumeric(v: r._value))
+	|> aggregateWindow(every: task.every, fn: mean, createEmpty: false)
+	|> to(bucket: {target})
+'''
+
+def flux_string(s):
+	s = s.replace('\\', '\\\\').replace('"', '\\"').replace('${', '\\${')
+	return u'"' + s + u'"'
+
 class InfluxDB2Client:
 	@classmethod
 	def get_kwargs(cls, settings):
@@ -19,6 +37,12 @@ class InfluxDB2Client:
 			add_arg_if_exists('token', ['token'])
 		add_arg_if_exists('org', ['org'])
 		kwargs['verify_ssl'] = settings.get_boolean(['verify_ssl'])
+		timeout = settings.get_float(['timeout'])
+		if timeout:
+			# 2.x wants milliseconds
+			kwargs['timeout'] = int(timeout * 1000)
+		add_arg_if_exists('connection_pool_maxsize', ['pool_size'], settings.get_int)
+		kwargs['enable_gzip'] = settings.get_boolean(['gzip'])
 		add_arg_if_exists('database', ['database'])
 
 		return kwargs
@@ -26,9 +50,14 @@ class InfluxDB2Client:
 	def __init__(self, **kwargs):
 		self.client = influxdb_client.InfluxDBClient(**kwargs)
 		self.database = None
+		# one write api for the life of the connection, which reuses
+		# the client's pooled connections
+		self.write_api = self.client.write_api(write_options=influxdb_client.client.write_api.SYNCHRONOUS)
 
 	def ping(self):
-		self.client.ping()
+		# this client returns False instead of raising
+		if not self.client.ping():
+			raise IOError("InfluxDB server did not answer ping")
 
 	def check_database(self, dbname):
 		buckets = self.client.buckets_api()
@@ -38,14 +67,51 @@ class InfluxDB2Client:
 		buckets = self.client.buckets_api()
 		buckets.create_bucket(bucket_name=dbname)
 
+	def set_retention(self, bucket, seconds):
+		bucket.retention_rules = [influxdb_client.BucketRetentionRules(type='expire', every_seconds=seconds)]
+		self.client.buckets_api().update_bucket(bucket)
+
+	def provision_rollups(self, dbname, rollup):
+		# a bucket to hold the rollups, and a task to fill it
+		buckets = self.client.buckets_api()
+		target = '{}_{}'.format(dbname, rollup['name'])
+		bucket = buckets.find_bucket_by_name(target)
+		if bucket is None:
+			rules = influxdb_client.BucketRetentionRules(type='expire', every_seconds=rollup['retention'])
+			buckets.create_bucket(bucket_name=target, retention_rules=rules, org=self.client.org)
+		else:
+			self.set_retention(bucket, rollup['retention'])
+		if rollup['raw_retention']:
+			self.set_retention(buckets.find_bucket_by_name(dbname), rollup['raw_retention'])
+
+		name = 'octoprint {}'.format(target)
+		flux = ROLLUP_TASK.format(
+			name=flux_string(name),
+			interval=octoprint_influxdb.rollup.duration(rollup['interval']),
+			source=flux_string(dbname),
+			measurements=u' or '.join(u'r._measurement == ' + flux_string(m) for m in rollup['measurements']),
+			target=flux_string(target),
+		)
+		tasks = self.client.tasks_api()
+		existing = tasks.find_tasks(name=name)
+		if existing:
+			tasks.update_task_request(existing[0].id, influxdb_client.TaskUpdateRequest(flux=flux, status='active'))
+		else:
+			tasks.create_task(task_create_request=influxdb_client.TaskCreateRequest(org=self.client.org, flux=flux, status='active'))
+		return True
+
 	def switch_database(self, dbname):
 		self.database = dbname
 
-	def write_points(self, points, retention_policy=None):
-		with self.client.write_api(write_options=influxdb_client.client.write_api.SYNCHRONOUS) as write:
-			write.write(bucket=self.database, record=points)
+	def write_points(self, points, retention_policy=None, precision='us'):
+		# points is a list of encoded line protocol bytes
+		self.write_api.write(bucket=self.database, record=b'\n'.join(points), write_precision=precision)
 
 	def close(self):
+		try:
+			self.write_api.close()
+		except Exception:
+			pass
 		try:
 			self.client.close()
 		except Exception:
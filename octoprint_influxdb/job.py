@@ -0,0 +1,75 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import threading
+
+def _add_to(d, k, x):
+	if x:
+		d[k] = x
+
+class JobCache:
+	# what we know about the loaded file, keyed by (origin, path, date,
+	# size), so static job data is only walked and written when it
+	# actually changes
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.key = None
+		# fields for the state measurement
+		self.fields = {}
+		# (tags, fields) for each filament point
+		self.filament = []
+
+	@staticmethod
+	def file_key(job):
+		jobfile = (job or {}).get('file') or {}
+		if not jobfile.get('name'):
+			return None
+		return (jobfile.get('origin'), jobfile.get('path') or jobfile.get('name'), jobfile.get('date'), jobfile.get('size'))
+
+	def update(self, job):
+		# returns True if the snapshot changed
+		key = self.file_key(job)
+		fields = {}
+		filament = []
+		if key is not None:
+			jobfile = job['file']
+			filename = jobfile['name']
+			_add_to(fields, 'average_print_time', job.get('averagePrintTime'))
+			_add_to(fields, 'estimated_print_time', job.get('estimatedPrintTime'))
+			filaments = job.get('filament')
+			if not filaments:
+				filaments = {}
+			for tool, filval in sorted(filaments.items()):
+				if not filval:
+					continue
+				_add_to(fields, 'filament_' + tool + '_length', filval.get('length'))
+				_add_to(fields, 'filament_' + tool + '_volume', filval.get('volume'))
+				filfields = {}
+				tags = {}
+				_add_to(filfields, 'length', filval.get('length'))
+				_add_to(filfields, 'volume', filval.get('volume'))
+				_add_to(tags, 'filename', filename)
+				_add_to(tags, 'tool', tool)
+				if filfields:
+					filament.append((tags, filfields))
+			_add_to(fields, 'file_date', jobfile.get('date'))
+			_add_to(fields, 'file', jobfile.get('display'))
+			_add_to(fields, 'file_size', jobfile.get('size'))
+			_add_to(fields, 'last_print_time', job.get('lastPrintTime'))
+			_add_to(fields, 'user', job.get('user'))
+
+		with self.lock:
+			if key == self.key and fields == self.fields and filament == self.filament:
+				return False
+			self.key = key
+			self.fields = fields
+			self.filament = filament
+			return True
+
+	def clear(self):
+		# returns True if there was anything to clear
+		return self.update(None)
+
+	def snapshot(self):
+		with self.lock:
+			return (self.fields, self.filament)
@@ -0,0 +1,128 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import math
+import sys
+import time
+
+# timestamp precisions, and how many ticks there are in a second
+PRECISIONS = {
+	's': 1,
+	'ms': 1000,
+	'us': 1000 * 1000,
+	'ns': 1000 * 1000 * 1000,
+}
+
+# how many measurement/tag combinations to remember
+PREFIX_CACHE_SIZE = 1024
+
+if sys.version_info < (3, 0):
+	text_type = unicode
+	INTEGER_TYPES = (int, long)
+else:
+	text_type = str
+	INTEGER_TYPES = (int,)
+
+def to_text(s):
+	if isinstance(s, text_type):
+		return s
+	if isinstance(s, bytes):
+		return s.decode('utf-8', 'replace')
+	return text_type(s)
+
+def _escaper(chars):
+	table = dict((ord(c), u'\\' + c) for c in chars)
+	def escape(s):
+		return to_text(s).translate(table)
+	return escape
+
+escape_measurement = _escaper(u', ')
+escape_key = _escaper(u',= ')
+escape_tag_value = _escaper(u',= ')
+escape_string = _escaper(u'"\\')
+
+def encode_field_value(v):
+	# returns None for values influx can't store
+	# bool first, since bools are also ints
+	if v is True:
+		return u'true'
+	elif v is False:
+		return u'false'
+	elif isinstance(v, INTEGER_TYPES):
+		return u'{}i'.format(v)
+	elif isinstance(v, float):
+		if math.isnan(v) or math.isinf(v):
+			return None
+		return repr(v)
+	elif isinstance(v, (text_type, bytes)):
+		return u'"' + escape_string(v).replace(u'\n', u'\\n') + u'"'
+	return None
+
+class LineEncoder:
+	def __init__(self, precision='us', common_tags=()):
+		# common_tags is a tuple of (key, value) pairs added to every point
+		if precision not in PRECISIONS:
+			# reasonable fallback
+			precision = 'us'
+		self.precision = precision
+		self.scale = PRECISIONS[precision]
+		self.common_tags = tuple(common_tags)
+		# escape these once, up front
+		self.common_escaped = dict((k, self.escape_tag(k, v)) for k, v in self.common_tags)
+		self.prefixes = {}
+		# field name -> escaped field name plus '='
+		self.keys = {}
+
+	@staticmethod
+	def escape_tag(k, v):
+		if v is None or v == '':
+			# influx does not allow empty tag values
+			return u''
+		return u',' + escape_key(k) + u'=' + escape_tag_value(v)
+
+	def timestamp(self, t=None):
+		# epoch seconds -> integer ticks at our precision
+		if t is None:
+			if self.precision == 'ns' and hasattr(time, 'time_ns'):
+				return time.time_ns()
+			t = time.time()
+		return int(t * self.scale)
+
+	def prefix(self, measurement, tags):
+		# tags should be a sorted tuple of (key, value) pairs, and
+		# override common tags with the same key
+		key = (measurement, tags)
+		prefix = self.prefixes.get(key)
+		if prefix is None:
+			escaped = self.common_escaped.copy()
+			for k, v in tags:
+				escaped[k] = self.escape_tag(k, v)
+			# influx prefers tags sorted by key
+			prefix = escape_measurement(measurement) + u''.join(escaped[k] for k in sorted(escaped)) + u' '
+			if len(self.prefixes) >= PREFIX_CACHE_SIZE:
+				self.prefixes.clear()
+			self.prefixes[key] = prefix
+		return prefix
+
+	def encode(self, measurement, tags, fields, timestamp=None):
+		# fields is a dict, returns None if there are no valid fields
+		# timestamp is in integer ticks, see timestamp()
+		parts = []
+		keys = self.keys
+		for k, v in fields.items():
+			v = encode_field_value(v)
+			if v is None:
+				continue
+			key = keys.get(k)
+			if key is None:
+				key = escape_key(k) + u'='
+				if len(keys) >= PREFIX_CACHE_SIZE:
+					keys.clear()
+				keys[k] = key
+			parts.append(key + v)
+		if not parts:
+			return None
+		if timestamp is None:
+			timestamp = self.timestamp()
+		line = self.prefix(measurement, tags) + u','.join(parts) + u' ' + u'{}'.format(timestamp)
+		return line.encode('utf-8')
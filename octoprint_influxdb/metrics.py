@@ -0,0 +1,122 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import threading
+
+# histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+class Histogram:
+	def __init__(self, bounds=BUCKETS_MS):
+		self.bounds = bounds
+		self.reset()
+
+	def reset(self):
+		# one extra bucket for everything past the last bound
+		self.counts = [0] * (len(self.bounds) + 1)
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self, ms):
+		i = 0
+		for bound in self.bounds:
+			if ms <= bound:
+				break
+			i += 1
+		self.counts[i] += 1
+		self.count += 1
+		self.total += ms
+		if ms > self.max:
+			self.max = ms
+
+	def percentile(self, p):
+		# upper bound of the bucket holding the p-th percentile
+		if not self.count:
+			return 0.0
+		target = p / 100.0 * self.count
+		seen = 0
+		for i, n in enumerate(self.counts):
+			seen += n
+			if seen >= target:
+				if i < len(self.bounds):
+					return min(float(self.bounds[i]), self.max)
+				break
+		return self.max
+
+	def summary(self, name):
+		return {
+			name + '_count': self.count,
+			name + '_mean': self.total / self.count if self.count else 0.0,
+			name + '_p50': self.percentile(50),
+			name + '_p99': self.percentile(99),
+			name + '_max': self.max,
+		}
+
+class PluginMetrics:
+	COUNTERS = [
+		'points_emitted',
+		'points_written',
+		'bytes_written',
+		'points_filtered',
+		'fields_filtered',
+		'points_spooled',
+		'points_rejected',
+		'write_errors',
+		'reconnects',
+		'health_failures',
+		'process_restarts',
+	]
+
+	HISTOGRAMS = [
+		'write_latency',
+		'gather_duration',
+		'encode_time',
+	]
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counters = dict((k, 0) for k in self.COUNTERS)
+		self.histograms = dict((k, Histogram()) for k in self.HISTOGRAMS)
+		# name -> function returning the current value
+		self.gauges = {}
+		# the last snapshot from a writer process, if any
+		self.remote = {}
+
+	def count(self, name, n=1):
+		with self.lock:
+			self.counters[name] += n
+
+	def observe(self, name, seconds):
+		with self.lock:
+			self.histograms[name].add(seconds * 1000.0)
+
+	def integer_fields(self):
+		# snapshot() fields that are always whole numbers
+		names = list(self.COUNTERS) + list(self.gauges.keys())
+		names += [name + '_ms_count' for name in self.HISTOGRAMS]
+		return names
+
+	def snapshot(self, reset=False):
+		# counters are totals since startup, histograms cover the time
+		# since the last reset
+		fields = {}
+		with self.lock:
+			fields.update(self.counters)
+			for name, hist in self.histograms.items():
+				fields.update(hist.summary(name + '_ms'))
+				if reset:
+					hist.reset()
+		for name, gauge in self.gauges.items():
+			try:
+				fields[name] = gauge()
+			except Exception:
+				pass
+		# counters and gauges add up, anything else we only have
+		# from the writer process
+		for name, v in self.remote.items():
+			if name in fields and (name in self.counters or name in self.gauges):
+				fields[name] += v
+			elif not fields.get(name):
+				fields[name] = v
+		return fields
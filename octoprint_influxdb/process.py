@@ -0,0 +1,405 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import collections
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+
+import monotonic
+
+import octoprint_influxdb.destination
+import octoprint_influxdb.metrics
+import octoprint_influxdb.writer
+import octoprint_influxdb_writer
+
+# messages to the child are raw bytes, the first byte says what it is
+# points are MSG_POINTS + precision + '\n' + lines, joined by '\n'
+MSG_POINTS = b'P'
+MSG_QUIT = b'Q'
+
+# how often the parent sends queued points, and the child reports back
+SEND_INTERVAL = 0.25
+REPORT_INTERVAL = 1.0
+
+# send early once this many points are queued
+SEND_BATCH = 1000
+
+# how long to wait before restarting a child that died, doubling each
+# time it dies without doing anything useful
+RESTART_MIN = 1.0
+RESTART_MAX = 60.0
+
+# metrics the child reports back to the parent
+CHILD_GAUGES = [
+	'queue_depth',
+	'points_dropped',
+	'spool_depth',
+	'spool_dropped',
+	'udp_datagrams',
+	'udp_oversized',
+	'udp_dropped',
+]
+
+def _context():
+	# a fresh interpreter, not a fork of one with a dozen threads
+	# running; python 2 can only fork
+	get_context = getattr(multiprocessing, 'get_context', None)
+	if get_context is None:
+		return multiprocessing
+	return get_context('spawn')
+
+class RemoteDestination:
+	# stands in for an InfluxDestination that lives in the child, so
+	# the plugin can still ask after it
+	def __init__(self, name, settings, defaults, process):
+		self.name = name
+		self.process = process
+		self.writer = None
+		self.spool = None
+		self.db = None
+		self.precision = octoprint_influxdb.destination.client_precision(settings, defaults)
+
+	def connected(self):
+		return self.process.status.get(self.name, (False, False))[0]
+
+	def spooling(self):
+		# until the child tells us otherwise, the parent holds on to
+		# points for it, like while it's starting or restarting
+		status = self.process.status.get(self.name)
+		if status is None:
+			return True
+		return status[1]
+
+	def wake(self, force=False):
+		# the child reconnects on its own, and restarts on new settings
+		pass
+
+	def stop(self, timeout=None):
+		pass
+
+class PipeHandler(logging.Handler):
+	# sends log records from the child back to the parent
+	def __init__(self, send):
+		logging.Handler.__init__(self)
+		self.send = send
+
+	def emit(self, record):
+		try:
+			self.send(('log', record.levelno, self.format(record)))
+		except Exception:
+			pass
+
+class WriterProcess:
+	# the parent side of a child process that owns every destination,
+	# with its clients, writer threads and spools. the plugin encodes
+	# points as usual and we pass the bytes over a pipe in batches, so
+	# client libraries and HTTP never touch this process.
+	def __init__(self, logger, metrics):
+		self.logger = logger
+		self.metrics = metrics
+		self.config = None
+		self.restart = False
+		self.queue = collections.deque()
+		self.queue_size = 1
+		self.overflow = octoprint_influxdb.writer.OVERFLOW_DROP_OLDEST
+		self.points_dropped = 0
+		self.cond = threading.Condition()
+		self.thread = None
+		self.running = False
+		# true while there's a child to send points to
+		self.alive = False
+		# name -> (connected, spooling), as last reported by the child
+		self.status = {}
+
+	def configure(self, values, defaults, data_folder):
+		config = (values, defaults, data_folder)
+		settings = octoprint_influxdb.destination.StaticSettings(values)
+		queue_size = settings.get_int(['queue_size'], min=1)
+		overflow = settings.get(['queue_overflow'])
+		if overflow not in octoprint_influxdb.writer.OVERFLOW_POLICIES:
+			overflow = octoprint_influxdb.writer.OVERFLOW_DROP_OLDEST
+		with self.cond:
+			self.queue_size = queue_size or defaults['queue_size']
+			self.overflow = overflow
+			if config != self.config:
+				self.config = config
+				self.restart = True
+			self.cond.notify_all()
+
+	def start(self):
+		if self.thread is not None:
+			return
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name="InfluxProcess")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self, timeout=None):
+		with self.cond:
+			self.running = False
+			self.cond.notify_all()
+		if self.thread:
+			self.thread.join(timeout)
+			self.thread = None
+
+	def pending(self):
+		return len(self.queue)
+
+	def dropped(self):
+		return self.points_dropped
+
+	def put(self, points):
+		# points is precision -> encoded line, as made by influx_emit
+		# a full queue is handled like the in-process writer handles it
+		with self.cond:
+			full = len(self.queue) >= self.queue_size
+			if full and self.overflow == octoprint_influxdb.writer.OVERFLOW_BLOCK and self.alive:
+				# only block while a child is taking points, not for
+				# however long it takes to restart one
+				self.cond.notify_all()
+				while self.running and self.alive and len(self.queue) >= self.queue_size:
+					self.cond.wait()
+			if len(self.queue) >= self.queue_size:
+				if self.overflow == octoprint_influxdb.writer.OVERFLOW_DROP_NEWEST:
+					self.points_dropped += 1
+					return
+				# with no child to wait for, block drops the oldest too
+				self.queue.popleft()
+				self.points_dropped += 1
+			self.queue.append(points)
+			if len(self.queue) == SEND_BATCH:
+				self.cond.notify_all()
+
+	def spawn(self):
+		values, defaults, data_folder = self.config
+		context = _context()
+		conn, child_conn = context.Pipe()
+		child = context.Process(
+			target=octoprint_influxdb_writer.run, name="InfluxWriter",
+			args=(child_conn, os.path.dirname(os.path.abspath(__file__)), values, defaults, data_folder),
+		)
+		child.daemon = True
+		child.start()
+		# so we see EOF if the child goes away
+		child_conn.close()
+		self.logger.info("Started writer process {}".format(child.pid))
+		return child, conn
+
+	def shutdown(self, child, conn, timeout=None):
+		# ask the child to write out what it has, then make sure it's gone
+		deadline = monotonic.monotonic() + (timeout or 0)
+		try:
+			conn.send_bytes(MSG_QUIT)
+			while child.is_alive() and monotonic.monotonic() < deadline:
+				if conn.poll(0.1):
+					self.receive(conn.recv())
+		except (EOFError, IOError, OSError):
+			# it closed its end, but may still be exiting
+			pass
+		child.join(max(0.1, deadline - monotonic.monotonic()))
+		if child.is_alive():
+			self.logger.warning("Writer process {} did not stop, terminating it.".format(child.pid))
+			child.terminate()
+			child.join(1)
+		conn.close()
+		self.status = {}
+
+	def receive(self, msg):
+		kind = msg[0]
+		if kind == 'log':
+			self.logger.log(msg[1], "writer process: {}".format(msg[2]))
+		elif kind == 'status':
+			self.status = msg[1]
+			self.metrics.remote = msg[2]
+
+	def send(self, conn, batch):
+		by_precision = collections.OrderedDict()
+		for points in batch:
+			for precision, point in points.items():
+				if point is not None:
+					by_precision.setdefault(precision, []).append(point)
+		for precision, lines in by_precision.items():
+			conn.send_bytes(MSG_POINTS + precision.encode('ascii') + b'\n' + b'\n'.join(lines))
+
+	def run(self):
+		child = conn = None
+		delay = RESTART_MIN
+		started = None
+		while True:
+			with self.cond:
+				if self.running and not self.restart and len(self.queue) < min(SEND_BATCH, self.queue_size):
+					self.cond.wait(SEND_INTERVAL)
+				running = self.running
+				restart = self.restart
+				self.restart = False
+				batch = list(self.queue)
+				self.queue.clear()
+				# room for anyone blocked in put
+				self.cond.notify_all()
+
+			if child is not None and not child.is_alive():
+				self.metrics.count('process_restarts')
+				if monotonic.monotonic() - started > RESTART_MAX:
+					# it was up for a good while, so start over
+					delay = RESTART_MIN
+				self.logger.error("Writer process {} exited with {}, restarting in {:.0f}s.".format(child.pid, child.exitcode, delay))
+				conn.close()
+				child = conn = None
+				self.status = {}
+				self.set_alive(False)
+				self.requeue(batch)
+				self.pause(delay)
+				delay = min(delay * 2, RESTART_MAX)
+				continue
+
+			if child is None:
+				if not running:
+					return
+				try:
+					child, conn = self.spawn()
+					started = monotonic.monotonic()
+					self.set_alive(True)
+					# a new child already has the new settings
+					restart = False
+				except Exception:
+					self.logger.exception("Cannot start writer process.")
+					self.requeue(batch)
+					self.pause(delay)
+					delay = min(delay * 2, RESTART_MAX)
+					continue
+
+			try:
+				if batch:
+					self.send(conn, batch)
+				while conn.poll():
+					self.receive(conn.recv())
+			except (EOFError, IOError, OSError):
+				# it died, we'll notice and restart it next time around
+				self.requeue(batch)
+				continue
+
+			if restart or not running:
+				# the old child writes out what it has before it goes
+				self.set_alive(False)
+				self.shutdown(child, conn, timeout=10)
+				child = conn = None
+				delay = RESTART_MIN
+
+	def set_alive(self, alive):
+		with self.cond:
+			self.alive = alive
+			self.cond.notify_all()
+
+	def pause(self, seconds):
+		with self.cond:
+			if self.running:
+				self.cond.wait(seconds)
+
+	def requeue(self, batch):
+		# put points back in front of anything newer
+		with self.cond:
+			self.queue.extendleft(reversed(batch))
+			if self.overflow == octoprint_influxdb.writer.OVERFLOW_BLOCK:
+				# this may run over by one batch, and put waits or
+				# drops until it's back under
+				return
+			while len(self.queue) > self.queue_size:
+				if self.overflow == octoprint_influxdb.writer.OVERFLOW_DROP_NEWEST:
+					self.queue.pop()
+				else:
+					self.queue.popleft()
+				self.points_dropped += 1
+
+def run_child(conn, values, defaults, data_folder):
+	# the child side, running every destination as the plugin would
+	# started by octoprint_influxdb_writer.run, see there
+	# ctrl-c goes to the whole process group, but the parent decides
+	# when we stop
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+	lock = threading.Lock()
+	def send(msg):
+		with lock:
+			conn.send(msg)
+
+	logger = logging.getLogger('octoprint.plugins.influxdb')
+	logger.setLevel(logging.INFO)
+	logger.propagate = False
+	logger.addHandler(PipeHandler(send))
+
+	metrics = octoprint_influxdb.metrics.PluginMetrics()
+	settings = octoprint_influxdb.destination.StaticSettings(values)
+	destinations = []
+	for name, dsettings, spool_name in octoprint_influxdb.destination.destination_specs(settings, defaults, logger, 'default'):
+		dest = octoprint_influxdb.destination.InfluxDestination(
+			name, dsettings, defaults, logger, metrics,
+			os.path.join(data_folder, spool_name),
+		)
+		dest.start()
+		destinations.append(dest)
+
+	def udp_stat(name):
+		return sum(getattr(getattr(d.db, 'udp', None), name, 0) for d in destinations)
+
+	metrics.gauges.update(
+		queue_depth=lambda: sum(d.writer.pending() for d in destinations if d.writer),
+		points_dropped=lambda: sum(d.writer.dropped + d.dropped for d in destinations if d.writer),
+		spool_depth=lambda: sum(d.spool.count for d in destinations if d.spool),
+		spool_dropped=lambda: sum(d.spool.dropped for d in destinations if d.spool),
+		udp_datagrams=lambda: udp_stat('datagrams'),
+		udp_oversized=lambda: udp_stat('oversized'),
+		udp_dropped=lambda: udp_stat('dropped'),
+	)
+
+	by_precision = {}
+	for dest in destinations:
+		by_precision.setdefault(dest.precision.encode('ascii'), []).append(dest)
+
+	stopped = threading.Event()
+	def report():
+		# histograms here are never reset, so they cover the child's
+		# whole life rather than one metrics interval
+		status = dict((d.name, (d.connected(), d.spooling())) for d in destinations)
+		fields = metrics.snapshot()
+		remote = dict((k, fields[k]) for k in list(metrics.COUNTERS) + CHILD_GAUGES if k in fields)
+		remote.update(metrics.histograms['write_latency'].summary('write_latency_ms'))
+		send(('status', status, remote))
+
+	def reporter():
+		while not stopped.wait(REPORT_INTERVAL):
+			try:
+				report()
+			except Exception:
+				return
+
+	thread = threading.Thread(target=reporter, name="InfluxReport")
+	thread.daemon = True
+	thread.start()
+
+	try:
+		while True:
+			try:
+				msg = conn.recv_bytes()
+			except (EOFError, IOError, OSError):
+				# the parent is gone
+				break
+			if msg[:1] == MSG_QUIT:
+				break
+			if msg[:1] == MSG_POINTS:
+				header, _, body = msg.partition(b'\n')
+				for dest in by_precision.get(header[1:], []):
+					for line in body.split(b'\n'):
+						dest.put(line)
+	finally:
+		stopped.set()
+		for dest in destinations:
+			# this writes out anything still queued
+			dest.stop(timeout=10)
+		try:
+			report()
+		except Exception:
+			pass
+		conn.close()
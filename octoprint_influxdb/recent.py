@@ -0,0 +1,131 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import array
+import math
+import numbers
+import threading
+
+# the most series (measurement, tags, field) to keep, in case
+# something makes up new names forever
+MAX_SERIES = 512
+
+class FieldRing:
+	# the last capacity (time, value) pairs of one numeric field,
+	# oldest first, in two preallocated arrays of doubles
+	__slots__ = ('times', 'values', 'capacity', 'start', 'count')
+
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.times = array.array('d', [0.0]) * capacity
+		self.values = array.array('d', [0.0]) * capacity
+		self.start = 0
+		self.count = 0
+
+	def add(self, t, v):
+		if self.count < self.capacity:
+			i = (self.start + self.count) % self.capacity
+			self.count += 1
+		else:
+			# full, overwrite the oldest
+			i = self.start
+			self.start = (self.start + 1) % self.capacity
+		self.times[i] = t
+		self.values[i] = v
+
+	def index(self, t):
+		# how many points are older than t
+		lo, hi = 0, self.count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.times[(self.start + mid) % self.capacity] < t:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+	def items(self, since=None, until=None):
+		lo = 0 if since is None else self.index(since)
+		hi = self.count if until is None else self.index(until)
+		out = []
+		for j in range(lo, hi):
+			i = (self.start + j) % self.capacity
+			out.append((self.times[i], self.values[i]))
+		return out
+
+def downsample(points, step):
+	# mean of each step-second bucket, stamped with the bucket start
+	out = []
+	bucket = None
+	total = 0.0
+	n = 0
+	for t, v in points:
+		b = math.floor(t / step) * step
+		if b != bucket:
+			if n:
+				out.append((bucket, total / n))
+			bucket = b
+			total = 0.0
+			n = 0
+		total += v
+		n += 1
+	if n:
+		out.append((bucket, total / n))
+	return out
+
+class RecentPoints:
+	def __init__(self, window, capacity):
+		# window is how many seconds back to serve, capacity is the
+		# most points kept per field
+		self.window = window
+		self.capacity = capacity
+		self.lock = threading.Lock()
+		# (measurement, tags, field) -> FieldRing
+		self.series = {}
+
+	def add(self, measurement, tags, fields, timestamp):
+		# tags is a sorted tuple of (key, value) pairs
+		with self.lock:
+			for k, v in fields.items():
+				if isinstance(v, bool) or not isinstance(v, numbers.Real):
+					continue
+				key = (measurement, tags, k)
+				ring = self.series.get(key)
+				if ring is None:
+					if len(self.series) >= MAX_SERIES:
+						continue
+					ring = self.series[key] = FieldRing(self.capacity)
+				ring.add(timestamp, v)
+
+	def names(self):
+		with self.lock:
+			keys = list(self.series.keys())
+		return [dict(measurement=m, tags=dict(tags), field=f) for m, tags, f in sorted(keys)]
+
+	def query(self, now, measurement=None, fields=None, start=None, end=None, step=None):
+		# start and end are epoch seconds, or if negative, seconds
+		# before now; nothing older than the window is returned
+		if start is not None and start < 0:
+			start = now + start
+		if end is not None and end < 0:
+			end = now + end
+		oldest = now - self.window
+		if start is None or start < oldest:
+			start = oldest
+
+		with self.lock:
+			selected = []
+			for key, ring in self.series.items():
+				m, tags, f = key
+				if measurement is not None and m != measurement:
+					continue
+				if fields and f not in fields:
+					continue
+				selected.append((key, ring.items(start, end)))
+
+		out = []
+		for (m, tags, f), points in sorted(selected):
+			if step:
+				points = downsample(points, step)
+			out.append(dict(measurement=m, tags=dict(tags), field=f, points=[list(p) for p in points]))
+		return out
@@ -0,0 +1,87 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import hashlib
+import io
+import json
+import os
+import threading
+
+# measurements worth keeping for long-range dashboards
+MEASUREMENTS = [
+	'temperature',
+	'progress',
+	'plugin_metrics',
+]
+
+# every destination shares the cache file
+_cache_lock = threading.Lock()
+
+def rollup_spec(settings, defaults):
+	# what the server should have, as a plain dict, or None if off
+	if not settings.get_boolean(['rollups']):
+		return None
+	name = settings.get(['rollup_name']) or defaults['rollup_name']
+	interval = settings.get_int(['rollup_interval'], min=1) or defaults['rollup_interval']
+	retention = settings.get_float(['rollup_retention'], min=0)
+	raw_retention = settings.get_float(['raw_retention'], min=0)
+	if retention is None:
+		retention = defaults['rollup_retention']
+	prefix = settings.get(['prefix']) or ''
+	return dict(
+		name=name,
+		measurements=[prefix + m for m in MEASUREMENTS],
+		interval=interval,
+		# days -> seconds, 0 keeps data forever
+		retention=int(retention * 86400),
+		raw_retention=int((raw_retention or 0) * 86400),
+		retention_policy=settings.get(['retention_policy']) or None,
+	)
+
+def duration(seconds):
+	# a duration both InfluxQL and Flux understand
+	if seconds and seconds % 86400 == 0:
+		return '{}d'.format(seconds // 86400)
+	return '{}s'.format(int(seconds))
+
+class RollupCache:
+	# remembers what each destination last set up, and where, in a small
+	# JSON file, so we only talk to the server when something changed
+	def __init__(self, path):
+		self.path = path
+
+	@staticmethod
+	def key(client, kwargs, spec):
+		# covers the server, database or bucket, and every rollup
+		# setting; connection kwargs hold credentials, so only a hash
+		# goes to disk
+		what = (client, sorted(kwargs.items()), json.dumps(spec, sort_keys=True))
+		return hashlib.sha1(repr(what).encode('utf-8')).hexdigest()
+
+	def load(self):
+		try:
+			with io.open(self.path, 'r', encoding='utf-8') as f:
+				return json.load(f)
+		except (IOError, OSError, ValueError):
+			return {}
+
+	def done(self, name, key):
+		with _cache_lock:
+			return self.load().get(name) == key
+
+	def mark(self, name, key):
+		# key None forgets the destination, so its rollups are set up
+		# again the next time they're turned on
+		with _cache_lock:
+			cache = self.load()
+			if cache.get(name) == key:
+				return
+			if key is None:
+				del cache[name]
+			else:
+				cache[name] = key
+			tmp = self.path + '.tmp'
+			with io.open(tmp, 'w', encoding='utf-8') as f:
+				f.write(u'' + json.dumps(cache, sort_keys=True, indent=1))
+			# rename won't replace a file on windows, on python 2
+			getattr(os, 'replace', os.rename)(tmp, self.path)
@@ -0,0 +1,115 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import math
+import threading
+import time
+
+class Job:
+	__slots__ = ('name', 'run', 'period', 'due')
+
+	def __init__(self, name, run, period):
+		self.name = name
+		self.run = run
+		# a function returning seconds between runs, or None to only
+		# run when triggered
+		self.period = period
+		self.due = None
+
+class Scheduler:
+	# runs every job on one thread, each at its own period
+	# runs are aligned to wall-clock multiples of the period, so a
+	# 10s job runs at :00, :10, :20... no matter when it was added
+	def __init__(self, logger, name="InfluxScheduler"):
+		self.logger = logger
+		self.name = name
+		self.jobs = {}
+		self.cond = threading.Condition()
+		self.running = False
+		self.thread = None
+
+	def add(self, name, run, period):
+		with self.cond:
+			job = Job(name, run, period)
+			self.jobs[name] = job
+			self.schedule(job, time.time())
+			self.cond.notify_all()
+
+	def schedule(self, job, now):
+		try:
+			period = job.period()
+		except Exception:
+			self.logger.exception("Cannot get period for {}".format(job.name))
+			period = None
+		if not period or period <= 0:
+			job.due = None
+			return
+		job.due = (math.floor(now / period) + 1) * period
+
+	def reschedule(self, name):
+		# call after a job's period changes
+		with self.cond:
+			job = self.jobs.get(name)
+			if job:
+				self.schedule(job, time.time())
+				self.cond.notify_all()
+
+	def trigger(self, name):
+		# run a job as soon as possible, keeping its schedule
+		with self.cond:
+			job = self.jobs.get(name)
+			if job:
+				job.due = time.time()
+				self.cond.notify_all()
+
+	def start(self):
+		with self.cond:
+			if self.running:
+				return
+			self.running = True
+		self.thread = threading.Thread(target=self.loop, name=self.name)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self, timeout=None):
+		with self.cond:
+			self.running = False
+			self.cond.notify_all()
+		if self.thread and self.thread is not threading.current_thread():
+			self.thread.join(timeout)
+		self.thread = None
+
+	def take_due(self):
+		# wait until something is due, and return it
+		with self.cond:
+			while self.running:
+				now = time.time()
+				due = []
+				wait = None
+				for job in self.jobs.values():
+					if job.due is not None and job.due - now > 2 * (job.period() or 0):
+						# the clock jumped backwards
+						self.schedule(job, now)
+					if job.due is None:
+						continue
+					if job.due <= now:
+						due.append(job)
+					elif wait is None or job.due - now < wait:
+						wait = job.due - now
+				if due:
+					for job in due:
+						self.schedule(job, now)
+					return due
+				self.cond.wait(wait)
+			return []
+
+	def loop(self):
+		while True:
+			due = self.take_due()
+			if not due:
+				return
+			for job in due:
+				try:
+					job.run()
+				except Exception:
+					self.logger.exception("Error running {}".format(job.name))
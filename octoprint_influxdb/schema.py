@@ -0,0 +1,152 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import math
+import numbers
+
+from octoprint_influxdb.lineprotocol import text_type
+
+FLOAT = 'float'
+INTEGER = 'integer'
+STRING = 'string'
+BOOLEAN = 'boolean'
+
+# fields we know the type of up front, by measurement
+# any other field keeps the type of the first value we see, the same
+# type it always had in the database
+DECLARED = {
+	'progress': {
+		'current_z': FLOAT,
+		'pct': INTEGER,
+		'completion': FLOAT,
+		'filepos': INTEGER,
+		'print_time': INTEGER,
+		'print_time_left': INTEGER,
+		'print_time_left_origin': STRING,
+	},
+	'state': {
+		'state': STRING,
+		'file': STRING,
+		'user': STRING,
+		'file_date': INTEGER,
+		'file_size': INTEGER,
+	},
+	'filament': {
+		'length': FLOAT,
+		'volume': FLOAT,
+	},
+	'events': {
+		'count': INTEGER,
+		'size': INTEGER,
+	},
+}
+
+# the most fields to remember per measurement, in case something
+# makes up new field names forever
+MAX_FIELDS = 1000
+
+TRUE_STRINGS = set(['true', 'yes', 'y', '1', 'on'])
+
+def to_float(v):
+	if isinstance(v, numbers.Real):
+		return float(v)
+	try:
+		return float(v)
+	except (TypeError, ValueError):
+		return None
+
+def to_integer(v):
+	if isinstance(v, bool):
+		return int(v)
+	if isinstance(v, numbers.Integral):
+		return v
+	v = to_float(v)
+	if v is None or math.isnan(v) or math.isinf(v):
+		return None
+	return int(round(v))
+
+def to_string(v):
+	if isinstance(v, text_type):
+		return v
+	if isinstance(v, bytes):
+		return v.decode('utf-8', 'replace')
+	if isinstance(v, bool):
+		return u'true' if v else u'false'
+	if isinstance(v, numbers.Real):
+		return text_type(v)
+	return None
+
+def to_boolean(v):
+	if isinstance(v, bool):
+		return v
+	if isinstance(v, numbers.Real):
+		return bool(v)
+	if isinstance(v, (text_type, bytes)):
+		return to_string(v).strip().lower() in TRUE_STRINGS
+	return None
+
+COERCE = {
+	FLOAT: to_float,
+	INTEGER: to_integer,
+	STRING: to_string,
+	BOOLEAN: to_boolean,
+}
+
+def type_of(v):
+	# the type a field gets when we first see it, or None if influx
+	# can't store it at all
+	if isinstance(v, bool):
+		return BOOLEAN
+	if isinstance(v, numbers.Integral):
+		return INTEGER
+	if isinstance(v, numbers.Real):
+		return FLOAT
+	if isinstance(v, (text_type, bytes)):
+		return STRING
+	return None
+
+class FieldSchema:
+	def __init__(self, rename={}, declared=DECLARED):
+		# rename maps field names influx won't accept to ones it will
+		self.rename = dict(rename)
+		self.declared = dict((m, dict(f)) for m, f in declared.items())
+		# measurement -> field -> (output name, coerce function)
+		self.fields = {}
+
+	def declare(self, measurement, fields):
+		self.declared.setdefault(measurement, {}).update(fields)
+		self.fields.pop(measurement, None)
+
+	def learn(self, measurement, k, v):
+		kind = self.declared.get(measurement, {}).get(k)
+		if kind is None:
+			kind = type_of(v)
+			if kind is None:
+				# don't remember this, the next value might be usable
+				return None
+		return (self.rename.get(k, k), COERCE[kind])
+
+	def apply(self, measurement, fields):
+		# returns a new dict of fields, renamed and coerced to the type
+		# each field had the first time we saw it
+		known = self.fields.get(measurement)
+		if known is None:
+			known = self.fields[measurement] = {}
+		out = {}
+		for k, v in fields.items():
+			entry = known.get(k)
+			if entry is None:
+				if v is None:
+					continue
+				entry = self.learn(measurement, k, v)
+				if entry is None:
+					continue
+				if len(known) < MAX_FIELDS:
+					known[k] = entry
+			name, coerce = entry
+			if v is None:
+				continue
+			v = coerce(v)
+			if v is not None:
+				out[name] = v
+		return out
@@ -0,0 +1,145 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import monotonic
+
+# how many sent-but-not-acknowledged commands we remember the send time
+# of, more than any printer's serial buffer will hold
+PENDING_SIZE = 64
+
+# fields that are always whole numbers
+INTEGER_FIELDS = [
+	'commands',
+	'bytes_sent',
+	'lines_received',
+	'bytes_received',
+	'oks',
+	'resends',
+	'busy',
+	'stalls',
+]
+
+# a gap longer than this between an ok and our next command means the
+# printer was kept waiting on us
+STALL_SECONDS = 0.05
+
+class SerialStats:
+	# counters for the serial link, bumped from the comm thread on
+	# every line, so every method here is O(1) with no containers
+	# built per line. counters only ever go up; the gather thread reads
+	# them and works out the difference since last time.
+	__slots__ = (
+		'commands', 'bytes_sent', 'lines', 'bytes_received',
+		'oks', 'resends', 'busy', 'stalls',
+		'latency_total', 'latency_count', 'latency_max', 'gap_max',
+		'pending', 'head', 'tail', 'last_ok',
+		'last',
+	)
+
+	def __init__(self):
+		self.commands = 0
+		self.bytes_sent = 0
+		self.lines = 0
+		self.bytes_received = 0
+		self.oks = 0
+		self.resends = 0
+		self.busy = 0
+		self.stalls = 0
+		self.latency_total = 0.0
+		self.latency_count = 0
+		self.latency_max = 0.0
+		self.gap_max = 0.0
+		# ring of send times for commands waiting on an ok
+		self.pending = [0.0] * PENDING_SIZE
+		self.head = 0
+		self.tail = 0
+		self.last_ok = None
+		# counters as of the last emit, and when
+		self.last = None
+
+	def sent(self, cmd, printing=True):
+		now = monotonic.monotonic()
+		self.commands += 1
+		self.bytes_sent += len(cmd) + 1
+		last_ok = self.last_ok
+		if printing and last_ok is not None and self.head == self.tail:
+			# the printer had nothing from us since its last ok, and
+			# while printing that means it may run out of moves
+			gap = now - last_ok
+			if gap > self.gap_max:
+				self.gap_max = gap
+			if gap > STALL_SECONDS:
+				self.stalls += 1
+		nxt = (self.head + 1) % PENDING_SIZE
+		if nxt == self.tail:
+			# full, so we lost track; forget the oldest
+			self.tail = (self.tail + 1) % PENDING_SIZE
+		self.pending[self.head] = now
+		self.head = nxt
+
+	def received(self, line):
+		self.lines += 1
+		self.bytes_received += len(line)
+		if line.startswith('ok'):
+			now = monotonic.monotonic()
+			self.oks += 1
+			self.last_ok = now
+			if self.head != self.tail:
+				latency = now - self.pending[self.tail]
+				self.tail = (self.tail + 1) % PENDING_SIZE
+				self.latency_total += latency
+				self.latency_count += 1
+				if latency > self.latency_max:
+					self.latency_max = latency
+		elif line.startswith('Resend') or line.startswith('rs '):
+			self.resends += 1
+		elif line.startswith('echo:busy'):
+			self.busy += 1
+
+	def reset_pending(self):
+		# after a disconnect, nothing we sent will be acknowledged
+		self.head = self.tail = 0
+		self.last_ok = None
+
+	def emit(self):
+		# fields covering everything since the last call, or None the
+		# first time around
+		now = monotonic.monotonic()
+		totals = (
+			self.commands, self.bytes_sent, self.lines, self.bytes_received,
+			self.oks, self.resends, self.busy, self.stalls,
+			self.latency_total, self.latency_count,
+		)
+		latency_max = self.latency_max
+		gap_max = self.gap_max
+		# these two can race with the comm thread, but losing one
+		# maximum is harmless
+		self.latency_max = 0.0
+		self.gap_max = 0.0
+
+		last = self.last
+		self.last = (now, totals)
+		if last is None:
+			return None
+		elapsed = now - last[0]
+		if elapsed <= 0:
+			return None
+		d = [a - b for a, b in zip(totals, last[1])]
+		commands, bytes_sent, lines, bytes_received, oks, resends, busy, stalls, latency_total, latency_count = d
+		fields = dict(
+			commands=commands,
+			commands_per_sec=commands / elapsed,
+			bytes_sent=bytes_sent,
+			bytes_sent_per_sec=bytes_sent / elapsed,
+			lines_received=lines,
+			bytes_received=bytes_received,
+			oks=oks,
+			resends=resends,
+			busy=busy,
+			stalls=stalls,
+			send_gap_max_ms=gap_max * 1000.0,
+		)
+		if latency_count:
+			fields['ok_latency_mean_ms'] = latency_total / latency_count * 1000.0
+			fields['ok_latency_max_ms'] = latency_max * 1000.0
+		return fields
@@ -0,0 +1,140 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import sqlite3
+import threading
+
+class InfluxSpool:
+	def __init__(self, path, max_size, logger):
+		# max_size is in bytes of stored point data
+		self.path = path
+		self.max_size = max_size
+		self.logger = logger
+		self.lock = threading.Lock()
+		self.dropped = 0
+
+		self.db = sqlite3.connect(path, check_same_thread=False)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("PRAGMA synchronous=NORMAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS lines (id INTEGER PRIMARY KEY AUTOINCREMENT, precision TEXT NOT NULL, data BLOB NOT NULL)")
+		self.db.commit()
+
+		row = self.db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM lines").fetchone()
+		self.count, self.size = row
+		if self.count:
+			self.logger.info("Spool has {} points waiting to be written.".format(self.count))
+
+	def append(self, points, precision):
+		# points are encoded line protocol, with timestamps at precision
+		rows = [(precision, sqlite3.Binary(p)) for p in points]
+		with self.lock:
+			with self.db:
+				self.db.executemany("INSERT INTO lines (precision, data) VALUES (?, ?)", rows)
+			self.count += len(rows)
+			self.size += sum(len(p) for p in points)
+			self.trim()
+
+	def trim(self):
+		# must be called with the lock held
+		# throw away the oldest points until we're under the cap
+		while self.size > self.max_size and self.count:
+			excess = self.size - self.max_size
+			# guess how many rows we need to drop, from the average size
+			n = max(1, int(excess * self.count / self.size) + 1)
+			row = self.db.execute("SELECT MAX(id), COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM (SELECT id, data FROM lines ORDER BY id LIMIT ?)", (n,)).fetchone()
+			maxid, dropped, size = row
+			with self.db:
+				self.db.execute("DELETE FROM lines WHERE id <= ?", (maxid,))
+			self.count -= dropped
+			self.size -= size
+			self.dropped += dropped
+			self.logger.warning("Spool is full, dropped {} oldest points.".format(dropped))
+
+	def peek(self, n):
+		# returns (last id, precision, points) for up to n oldest points
+		# that all share the same precision
+		with self.lock:
+			rows = self.db.execute("SELECT id, precision, data FROM lines ORDER BY id LIMIT ?", (n,)).fetchall()
+		if not rows:
+			return (None, None, [])
+		precision = rows[0][1]
+		points = []
+		lastid = None
+		for rowid, rowprecision, data in rows:
+			if rowprecision != precision:
+				break
+			lastid = rowid
+			points.append(bytes(data))
+		return (lastid, precision, points)
+
+	def discard(self, lastid):
+		# remove everything up to and including lastid, after a replay
+		with self.lock:
+			row = self.db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM lines WHERE id <= ?", (lastid,)).fetchone()
+			with self.db:
+				self.db.execute("DELETE FROM lines WHERE id <= ?", (lastid,))
+			self.count -= row[0]
+			self.size -= row[1]
+
+	def close(self):
+		with self.lock:
+			try:
+				self.db.close()
+			except Exception:
+				pass
+
+class SpoolReplayer:
+	def __init__(self, spool, write, logger, rate=1000, batch_size=5000):
+		# write is called with a list of points and their precision,
+		# and returns True once they can be removed from the spool,
+		# written or rejected by the server
+		self.spool = spool
+		self.write = write
+		self.logger = logger
+		self.rate = rate
+		self.batch_size = batch_size
+
+		self.wakeup = threading.Event()
+		self.stopped = threading.Event()
+		self.running = False
+		self.thread = None
+
+	def start(self):
+		if self.running:
+			return
+		self.running = True
+		self.stopped.clear()
+		self.thread = threading.Thread(target=self.run, name="InfluxSpoolReplayer")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self, timeout=None):
+		self.running = False
+		self.stopped.set()
+		self.wakeup.set()
+		if self.thread:
+			self.thread.join(timeout)
+			self.thread = None
+
+	def wake(self):
+		# call this once a connection is (re)established
+		self.wakeup.set()
+
+	def run(self):
+		while self.running:
+			self.wakeup.wait()
+			self.wakeup.clear()
+
+			while self.running and self.spool.count:
+				lastid, precision, points = self.spool.peek(self.batch_size)
+				if not points:
+					break
+				if not self.write(points, precision):
+					# disconnected again, wait to be woken up
+					break
+				self.spool.discard(lastid)
+				self.logger.debug("Replayed {} spooled points, {} remaining.".format(len(points), self.spool.count))
+
+				# leave room for live writes in between replay batches
+				if self.rate > 0:
+					self.stopped.wait(len(points) / float(self.rate))
@@ -0,0 +1,171 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import threading
+
+# a heater is at its target once it's within this many degrees
+TARGET_MARGIN = 2.0
+
+# and has settled once it stays there for this many seconds
+SETTLE_SECONDS = 30.0
+
+# fields that are always whole numbers
+INTEGER_FIELDS = [
+	'pause_count',
+	'temperature_samples',
+]
+
+class HeaterSummary:
+	# running figures for one heater over one print, in constant space
+	__slots__ = (
+		'target', 'heatup_time', 'reached', 'inside_since', 'settle_time',
+		'overshoot', 'deviation_total', 'deviation_count',
+	)
+
+	def __init__(self):
+		self.target = None
+		# seconds from print start to first reaching the target
+		self.heatup_time = None
+		# when we last reached the current target, or None if we haven't
+		self.reached = None
+		self.inside_since = None
+		# seconds from reaching the target to staying there
+		self.settle_time = None
+		self.overshoot = 0.0
+		self.deviation_total = 0.0
+		self.deviation_count = 0
+
+	def add(self, t, start, actual, target):
+		if not target or target <= 0:
+			# off, or not being controlled
+			self.target = None
+			self.reached = self.inside_since = None
+			return
+		if self.target is None or abs(target - self.target) > TARGET_MARGIN:
+			# a new target, so we're heating (or cooling) again
+			self.target = target
+			self.reached = self.inside_since = None
+
+		error = actual - target
+		inside = abs(error) <= TARGET_MARGIN
+		if self.reached is None:
+			if not inside:
+				return
+			self.reached = t
+			if self.heatup_time is None:
+				self.heatup_time = t - start
+
+		if error > self.overshoot:
+			self.overshoot = error
+		self.deviation_total += abs(error)
+		self.deviation_count += 1
+
+		if not inside:
+			self.inside_since = None
+		elif self.inside_since is None:
+			self.inside_since = t
+		elif self.settle_time is None and t - self.inside_since >= SETTLE_SECONDS:
+			self.settle_time = self.inside_since - self.reached
+
+	def fields(self, heater):
+		fields = {}
+		if self.heatup_time is not None:
+			fields[heater + '_heatup_time'] = self.heatup_time
+			fields[heater + '_overshoot'] = self.overshoot
+		if self.settle_time is not None:
+			fields[heater + '_settle_time'] = self.settle_time
+		if self.deviation_count:
+			fields[heater + '_deviation_mean'] = self.deviation_total / self.deviation_count
+		return fields
+
+class PrintSummary:
+	# accumulates one print, from PrintStarted to PrintDone or
+	# PrintFailed, into the fields of a single print_summary point
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.clear()
+
+	def clear(self):
+		# None when there's no print going
+		self.start = None
+		self.file = None
+		self.estimated = None
+		# heater name -> HeaterSummary
+		self.heaters = {}
+		self.samples = 0
+		self.paused = None
+		self.pause_time = 0.0
+		self.pause_count = 0
+		self.max_z = None
+
+	def begin(self, t, job_fields):
+		with self.lock:
+			self.clear()
+			self.start = t
+			self.file = job_fields.get('file')
+			self.estimated = job_fields.get('estimated_print_time')
+
+	def temperatures(self, t, fields):
+		# fields as written to the temperature measurement
+		if self.start is None:
+			return
+		with self.lock:
+			if self.start is None:
+				return
+			self.samples += 1
+			for k, actual in fields.items():
+				if not k.endswith('_actual') or actual is None:
+					continue
+				heater = k[:-len('_actual')]
+				target = fields.get(heater + '_target')
+				summary = self.heaters.get(heater)
+				if summary is None:
+					summary = self.heaters[heater] = HeaterSummary()
+				summary.add(t, self.start, actual, target)
+
+	def progress(self, fields):
+		z = fields.get('current_z')
+		if self.start is None or z is None:
+			return
+		with self.lock:
+			if self.max_z is None or z > self.max_z:
+				self.max_z = z
+
+	def pause(self, t):
+		with self.lock:
+			if self.start is not None and self.paused is None:
+				self.paused = t
+				self.pause_count += 1
+
+	def resume(self, t):
+		with self.lock:
+			if self.paused is not None:
+				self.pause_time += t - self.paused
+				self.paused = None
+
+	def finish(self, t, print_time=None):
+		# returns the summary fields, or None if we never saw it start
+		with self.lock:
+			if self.start is None:
+				return None
+			if self.paused is not None:
+				self.pause_time += t - self.paused
+			if print_time is None:
+				print_time = t - self.start
+			fields = dict(
+				print_time=float(print_time),
+				pause_time=self.pause_time,
+				pause_count=self.pause_count,
+				temperature_samples=self.samples,
+			)
+			if self.file:
+				fields['file'] = self.file
+			if self.estimated:
+				fields['estimated_print_time'] = float(self.estimated)
+				fields['estimate_error'] = print_time - self.estimated
+			if self.max_z is not None:
+				fields['max_z'] = self.max_z
+			for heater, summary in self.heaters.items():
+				fields.update(summary.fields(heater))
+			self.clear()
+			return fields
@@ -0,0 +1,57 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import socket
+
+# fits in one ethernet frame with room to spare for tunnels and VPNs
+DEFAULT_PAYLOAD = 1400
+
+# the most a single UDP datagram can carry over IPv4
+MAX_PAYLOAD = 65507
+
+class UDPPacker:
+	def __init__(self, host, port, payload=DEFAULT_PAYLOAD):
+		self.payload = max(1, min(payload, MAX_PAYLOAD))
+		# resolve once, not on every send
+		family, socktype, proto, _, addr = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0]
+		self.addr = addr
+		self.sock = socket.socket(family, socktype, proto)
+
+		self.datagrams = 0
+		self.oversized = 0
+		self.dropped = 0
+
+	def send(self, points):
+		# points is a list of encoded line protocol bytes
+		# pack as many lines as will fit into each datagram
+		buf = []
+		size = 0
+		for p in points:
+			n = len(p) + 1
+			if n > self.payload:
+				if n > MAX_PAYLOAD:
+					# this can't be sent at all
+					self.dropped += 1
+					continue
+				# this will be fragmented, but send it anyway
+				self.oversized += 1
+				self.sendto([p])
+				continue
+			if size + n > self.payload:
+				self.sendto(buf)
+				buf = []
+				size = 0
+			buf.append(p)
+			size += n
+		if buf:
+			self.sendto(buf)
+
+	def sendto(self, lines):
+		self.sock.sendto(b'\n'.join(lines) + b'\n', self.addr)
+		self.datagrams += 1
+
+	def close(self):
+		try:
+			self.sock.close()
+		except Exception:
+			pass
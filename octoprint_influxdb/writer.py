@@ -0,0 +1,139 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import collections
+import threading
+
+import monotonic
+
+# what to do with a new point when the queue is full
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_BLOCK = "block"
+
+OVERFLOW_POLICIES = [
+	OVERFLOW_DROP_OLDEST,
+	OVERFLOW_DROP_NEWEST,
+	OVERFLOW_BLOCK,
+]
+
+class InfluxWriter:
+	def __init__(self, write, logger, queue_size=10000, batch_size=500, max_age=5.0, overflow=OVERFLOW_DROP_OLDEST):
+		# write is called from the worker thread with a list of points
+		self.write = write
+		self.logger = logger
+		self.configure(queue_size, batch_size, max_age, overflow)
+
+		self.queue = collections.deque()
+		self.cond = threading.Condition()
+		self.oldest = None
+		self.flushing = False
+		self.running = False
+		self.thread = None
+		self.dropped = 0
+
+	def configure(self, queue_size, batch_size, max_age, overflow):
+		self.queue_size = max(1, queue_size)
+		self.batch_size = max(1, min(batch_size, self.queue_size))
+		self.max_age = max(0.0, max_age)
+		if overflow not in OVERFLOW_POLICIES:
+			# reasonable fallback
+			overflow = OVERFLOW_DROP_OLDEST
+		self.overflow = overflow
+
+	def start(self):
+		with self.cond:
+			if self.running:
+				return
+			self.running = True
+		self.thread = threading.Thread(target=self.run, name="InfluxWriter")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self, timeout=None):
+		# stop accepting points, write out whatever is left, and exit
+		with self.cond:
+			self.running = False
+			self.cond.notify_all()
+		if self.thread:
+			self.thread.join(timeout)
+			self.thread = None
+
+	def flush(self):
+		# ask the worker to write everything queued now, without waiting
+		with self.cond:
+			if self.queue:
+				self.flushing = True
+				self.cond.notify_all()
+
+	def put(self, point):
+		with self.cond:
+			if len(self.queue) >= self.queue_size:
+				if self.overflow == OVERFLOW_BLOCK:
+					while self.running and len(self.queue) >= self.queue_size:
+						self.cond.wait()
+					if len(self.queue) >= self.queue_size:
+						# we stopped while waiting, nowhere to put this
+						self.dropped += 1
+						return False
+				elif self.overflow == OVERFLOW_DROP_NEWEST:
+					self.dropped += 1
+					return False
+				else:
+					self.queue.popleft()
+					self.dropped += 1
+
+			if not self.queue:
+				# the worker needs to start the clock on this batch
+				self.oldest = monotonic.monotonic()
+				self.cond.notify_all()
+			self.queue.append(point)
+			if len(self.queue) >= self.batch_size:
+				self.cond.notify_all()
+			return True
+
+	def pending(self):
+		return len(self.queue)
+
+	def ready(self, now):
+		if not self.queue:
+			return False
+		if self.flushing or not self.running:
+			return True
+		if len(self.queue) >= self.batch_size:
+			return True
+		return now - self.oldest >= self.max_age
+
+	def take_batch(self):
+		# must be called with the condition held
+		n = min(self.batch_size, len(self.queue))
+		batch = [self.queue.popleft() for _ in range(n)]
+		if self.queue:
+			# we don't track per-point ages, so restart the clock
+			self.oldest = monotonic.monotonic()
+		else:
+			self.oldest = None
+			self.flushing = False
+		# wake up anyone blocked on a full queue
+		self.cond.notify_all()
+		return batch
+
+	def run(self):
+		while True:
+			with self.cond:
+				while True:
+					now = monotonic.monotonic()
+					if self.ready(now):
+						break
+					if not self.running:
+						return
+					if self.queue:
+						self.cond.wait(max(0.0, self.oldest + self.max_age - now))
+					else:
+						self.cond.wait()
+				batch = self.take_batch()
+
+			try:
+				self.write(batch)
+			except Exception:
+				self.logger.exception("Error writing batch of {} points.".format(len(batch)))
@@ -0,0 +1,20 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+# the entry point for the plugin's writer process. it lives outside the
+# plugin package so the child can load the plugin's modules without
+# running octoprint_influxdb/__init__.py, which imports OctoPrint and
+# flask, none of which the child needs
+
+import sys
+import types
+
+def run(conn, package_path, values, defaults, data_folder):
+	if 'octoprint_influxdb' not in sys.modules:
+		# an empty stand-in for the plugin package, so its modules
+		# import as usual
+		package = types.ModuleType('octoprint_influxdb')
+		package.__path__ = [package_path]
+		sys.modules['octoprint_influxdb'] = package
+	import octoprint_influxdb.process
+	octoprint_influxdb.process.run_child(conn, values, defaults, data_folder)
@@ -33,7 +33,7 @@ plugin_url = "https://github.com/agrif/OctoPrint-InfluxDB"
 plugin_license = "AGPLv3"
 
 # Any additional requirements besides OctoPrint should be listed here
-plugin_requires = ["influxdb>=5.2,<6", "influxdb-client>=1.37,<2", "monotonic>=1.5,<2"]
+plugin_requires = ["influxdb>=5.3,<6", "influxdb-client>=1.37,<2", "monotonic>=1.5,<2"]
 
 ### --------------------------------------------------------------------------------------------------------------------
 ### More advanced options that you usually shouldn't have to touch follow after this point
@@ -46,7 +46,7 @@ plugin_requires = ["influxdb>=5.2,<6", "influxdb-client>=1.37,<2", "monotonic>=1
 plugin_additional_data = []
 
 # Any additional python packages you need to install with your plugin that are not contained in <plugin_package>.*
-plugin_additional_packages = []
+plugin_additional_packages = ["octoprint_influxdb_writer"]
 
 # Any python packages within <plugin_package>.* you do NOT want to install with your plugin
 plugin_ignored_packages = []
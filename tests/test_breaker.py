@@ -0,0 +1,43 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import unittest
+
+from octoprint_influxdb.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+class CircuitBreakerTest(unittest.TestCase):
+	def test_backoff_grows_to_maximum(self):
+		breaker = CircuitBreaker(base=1.0, maximum=10.0, jitter=0.0)
+		delays = []
+		for _ in range(6):
+			breaker.failure()
+			delays.append(breaker.delay())
+		self.assertEqual(delays, [1.0, 2.0, 4.0, 8.0, 10.0, 10.0])
+
+	def test_jitter_only_shortens(self):
+		breaker = CircuitBreaker(base=4.0, maximum=10.0, jitter=0.5)
+		breaker.failure()
+		for _ in range(50):
+			self.assertTrue(2.0 <= breaker.delay() <= 4.0)
+
+	def test_states(self):
+		breaker = CircuitBreaker(base=0.0, jitter=0.0)
+		self.assertTrue(breaker.allow())
+		breaker.failure()
+		self.assertEqual(breaker.state, OPEN)
+		# no delay, so the next attempt is let through
+		self.assertTrue(breaker.allow())
+		self.assertEqual(breaker.state, HALF_OPEN)
+		breaker.success()
+		self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+
+	def test_open_blocks(self):
+		breaker = CircuitBreaker(base=60.0, jitter=0.0)
+		breaker.failure()
+		self.assertFalse(breaker.allow())
+		self.assertGreater(breaker.remaining(), 50)
+		breaker.reset()
+		self.assertTrue(breaker.allow())
+
+if __name__ == '__main__':
+	unittest.main()
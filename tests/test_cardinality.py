@@ -0,0 +1,56 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from octoprint_influxdb.cardinality import CardinalityGuard
+
+class CardinalityGuardTest(unittest.TestCase):
+	def apply(self, guard, value, fields={}):
+		tags = {'filename': value}
+		fields, _ = guard.apply(tags, dict(fields))
+		return tags, fields
+
+	def test_keeps_first_values(self):
+		guard = CardinalityGuard({'filename': (2, 'field')})
+		self.assertEqual(self.apply(guard, 'a'), ({'filename': 'a'}, {}))
+		self.assertEqual(self.apply(guard, 'b'), ({'filename': 'b'}, {}))
+		self.assertEqual(self.apply(guard, 'c', {'v': 1}), ({}, {'v': 1, 'filename': 'c'}))
+		# using an old value again doesn't let a new one in
+		self.apply(guard, 'a')
+		self.assertEqual(self.apply(guard, 'c'), ({}, {'filename': 'c'}))
+		self.assertEqual(self.apply(guard, 'b'), ({'filename': 'b'}, {}))
+
+	def test_policies(self):
+		guard = CardinalityGuard({'filename': (0, 'other')})
+		self.assertEqual(self.apply(guard, 'a')[0], {'filename': 'other'})
+		guard = CardinalityGuard({'filename': (0, 'hash')})
+		tags = self.apply(guard, 'a')[0]
+		self.assertEqual(tags, self.apply(guard, 'a')[0])
+		self.assertTrue(tags['filename'].startswith('hash-'))
+
+	def test_filled_reported_once(self):
+		guard = CardinalityGuard({'filename': (0, 'other')})
+		self.assertEqual(guard.apply({'filename': 'a'}, {})[1], ['filename'])
+		self.assertEqual(guard.apply({'filename': 'b'}, {})[1], [])
+
+	def test_survives_restart(self):
+		folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, folder)
+		path = os.path.join(folder, 'tag_values.json')
+		guard = CardinalityGuard({'filename': (3, 'other')})
+		for v in ['a', 'b', 'c', 'a']:
+			self.apply(guard, v)
+		guard.save(path)
+		# a lower limit keeps the oldest values
+		guard = CardinalityGuard({'filename': (2, 'other')})
+		guard.load(path)
+		self.assertEqual(self.apply(guard, 'a')[0], {'filename': 'a'})
+		self.assertEqual(self.apply(guard, 'b')[0], {'filename': 'b'})
+		self.assertEqual(self.apply(guard, 'c')[0], {'filename': 'other'})
+
+if __name__ == '__main__':
+	unittest.main()
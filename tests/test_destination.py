@@ -0,0 +1,152 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import octoprint_influxdb.destination
+import octoprint_influxdb.metrics
+import octoprint_influxdb.spool
+
+class ServerError(Exception):
+	def __init__(self, code):
+		Exception.__init__(self, "server said {}".format(code))
+		self.code = code
+
+class FakeClient:
+	# rejects any batch holding a point that starts with b'bad'
+	def __init__(self, fail=None, max_points=None):
+		self.fail = fail
+		self.max_points = max_points
+		self.written = []
+		self.closed = False
+
+	def write_points(self, points, retention_policy=None, precision='us'):
+		if self.fail is not None:
+			raise self.fail
+		if self.max_points is not None and len(points) > self.max_points:
+			raise ServerError(413)
+		if any(p.startswith(b'bad') for p in points):
+			raise ServerError(400)
+		self.written.extend(points)
+
+	def close(self):
+		self.closed = True
+
+class InfluxDestinationTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.folder)
+		logger = logging.getLogger(__name__)
+		self.metrics = octoprint_influxdb.metrics.PluginMetrics()
+		self.dest = octoprint_influxdb.destination.InfluxDestination(
+			'test', octoprint_influxdb.destination.StaticSettings({}), {}, logger, self.metrics,
+			os.path.join(self.folder, 'spool.sqlite'),
+		)
+		self.dest.precision = 'us'
+		self.dest.spool = octoprint_influxdb.spool.InfluxSpool(self.dest.spool_path, 1024 * 1024, logger)
+		self.addCleanup(self.dest.spool.close)
+
+	def test_rejected_batch_is_dropped(self):
+		client = self.dest.db = FakeClient()
+		self.dest.write_batch([b'bad 1', b'good 2'])
+		self.assertIs(self.dest.db, client)
+		self.assertFalse(client.closed)
+		self.assertEqual(self.dest.spool.count, 0)
+		self.assertEqual(self.metrics.counters['points_rejected'], 2)
+		self.assertEqual(self.dest.breaker.failures, 0)
+
+	def test_too_large_batch_is_split(self):
+		client = self.dest.db = FakeClient(max_points=2)
+		points = [u'good {}'.format(i).encode('ascii') for i in range(7)]
+		self.dest.write_batch(points)
+		self.assertEqual(client.written, points)
+		self.assertEqual(self.dest.spool.count, 0)
+		self.assertEqual(self.metrics.counters['points_rejected'], 0)
+		self.assertIs(self.dest.db, client)
+
+	def test_too_large_point_is_dropped(self):
+		self.dest.db = FakeClient(max_points=0)
+		self.dest.write_batch([b'good 1'])
+		self.assertEqual(self.dest.spool.count, 0)
+		self.assertEqual(self.metrics.counters['points_rejected'], 1)
+
+	def test_connection_error_spools(self):
+		client = self.dest.db = FakeClient(fail=IOError("connection refused"))
+		self.dest.write_batch([b'good 1', b'good 2'])
+		self.assertIsNone(self.dest.db)
+		self.assertTrue(client.closed)
+		self.assertEqual(self.dest.spool.count, 2)
+		self.assertEqual(self.metrics.counters['points_rejected'], 0)
+
+	def test_server_error_spools(self):
+		self.dest.db = FakeClient(fail=ServerError(503))
+		self.dest.write_batch([b'good 1'])
+		self.assertIsNone(self.dest.db)
+		self.assertEqual(self.dest.spool.count, 1)
+
+	def test_lost_without_spool_counted(self):
+		self.dest.spool.close()
+		self.dest.spool = None
+		self.dest.db = None
+		self.dest.write_batch([b'good 1', b'good 2'])
+		self.assertEqual(self.dest.dropped, 2)
+
+	def test_spool_kept_across_settings_saves(self):
+		self.dest.spool.close()
+		self.dest.spool = None
+		values = dict(spool=True, spool_max_size=1, spool_replay_rate=0, spool_replay_batch=100)
+		self.dest.settings = octoprint_influxdb.destination.StaticSettings(values)
+		self.dest.start_spool()
+		spool = self.dest.spool
+		self.addCleanup(self.dest.stop, 5)
+		spool.append([b'good 1'], 'us')
+		self.dest.start_spool()
+		self.assertIs(self.dest.spool, spool)
+		# a new size gets a new spool, with the same points in it
+		values['spool_max_size'] = 2
+		self.dest.start_spool()
+		self.assertIsNot(self.dest.spool, spool)
+		self.assertEqual(self.dest.spool.count, 1)
+		values['spool'] = False
+		self.dest.start_spool()
+		self.assertIsNone(self.dest.spool)
+		self.dest.write_batch([b'good 2'])
+		self.assertEqual(self.dest.dropped, 1)
+
+	def test_bad_row_does_not_block_replay(self):
+		spool = self.dest.spool
+		spool.append([b'bad 1'], 'us')
+		spool.append([b'good 2', b'good 3'], 'ms')
+		client = self.dest.db = FakeClient()
+		replayer = octoprint_influxdb.spool.SpoolReplayer(spool, self.dest.write_points, logging.getLogger(__name__), rate=0)
+		replayer.start()
+		replayer.wake()
+		for _ in range(100):
+			if not spool.count:
+				break
+			replayer.stopped.wait(0.02)
+		replayer.stop(5)
+		self.assertEqual(spool.count, 0)
+		self.assertEqual(client.written, [b'good 2', b'good 3'])
+		self.assertIs(self.dest.db, client)
+
+class PrecisionTest(unittest.TestCase):
+	def precision(self, **values):
+		settings = octoprint_influxdb.destination.StaticSettings(values)
+		return octoprint_influxdb.destination.client_precision(settings, {'api_version': 2, 'precision': 'us'})
+
+	def test_precision(self):
+		self.assertEqual(self.precision(), 'us')
+		self.assertEqual(self.precision(precision='ms'), 'ms')
+		self.assertEqual(self.precision(precision='fortnights'), 'us')
+		# the 1.x UDP listener wants nanoseconds
+		self.assertEqual(self.precision(api_version=1, udp=True, precision='s'), 'ns')
+		self.assertEqual(self.precision(api_version='1', udp=False, precision='s'), 's')
+		self.assertEqual(self.precision(api_version=2, udp=True), 'us')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,46 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import unittest
+
+from octoprint_influxdb.filters import Deadband, EventFilter
+
+class DeadbandTest(unittest.TestCase):
+	def test_threshold_and_heartbeat(self):
+		deadband = Deadband(absolute=1.0, heartbeat=60)
+		self.assertEqual(deadband.filter('t', {'a': 200.0}, 0), {'a': 200.0})
+		self.assertEqual(deadband.filter('t', {'a': 200.5}, 1), {})
+		self.assertEqual(deadband.filter('t', {'a': 201.5}, 2), {'a': 201.5})
+		self.assertEqual(deadband.filter('t', {'a': 201.5}, 62), {'a': 201.5})
+
+	def test_overrides_and_strings(self):
+		deadband = Deadband(absolute=10.0, overrides={'z': 0.1})
+		deadband.filter('p', {'z': 1.0, 's': u'a'}, 0)
+		self.assertEqual(deadband.filter('p', {'z': 1.2, 's': u'a'}, 1), {'z': 1.2})
+		self.assertEqual(deadband.filter('p', {'s': u'b'}, 2), {'s': u'b'})
+
+class EventFilterTest(unittest.TestCase):
+	def test_allow_deny(self):
+		f = EventFilter(allow=['Print*', 'plugin_*'], deny=['plugin_noisy_*'])
+		self.assertEqual(f.admit('PrintStarted', {}, 0), 1)
+		self.assertEqual(f.admit('Connected', {}, 0), 0)
+		self.assertEqual(f.admit('plugin_foo_bar', {}, 0), 1)
+		self.assertEqual(f.admit('plugin_noisy_tick', {}, 0), 0)
+
+	def test_rate_limit_coalesces(self):
+		f = EventFilter(rate=1.0, burst=1)
+		self.assertEqual(f.admit('ZChange', {'new': 1}, 0.0), 1)
+		self.assertEqual(f.admit('ZChange', {'new': 2}, 0.1), 0)
+		self.assertEqual(f.admit('ZChange', {'new': 3}, 0.2), 0)
+		self.assertEqual(f.flush(0.5), [])
+		self.assertEqual(f.flush(1.2), [('ZChange', {'new': 3}, 2)])
+
+	def test_override_rate(self):
+		f = EventFilter(rate=0.0, overrides={'ZChange': 1.0}, burst=1)
+		f.admit('ZChange', {}, 0)
+		self.assertEqual(f.admit('ZChange', {}, 0.1), 0)
+		self.assertEqual(f.admit('Other', {}, 0.1), 1)
+		self.assertEqual(f.admit('Other', {}, 0.1), 1)
+
+if __name__ == '__main__':
+	unittest.main()
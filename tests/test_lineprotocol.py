@@ -0,0 +1,71 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import unittest
+
+from octoprint_influxdb.lineprotocol import LineEncoder, encode_field_value
+
+class EscapingTest(unittest.TestCase):
+	def encode(self, measurement, tags, fields, common=()):
+		return LineEncoder('s', common).encode(measurement, tags, fields, 1)
+
+	def test_measurement(self):
+		# commas and spaces, but not equals signs, in measurement names
+		line = self.encode(u'my meas,ure=ment', (), {'v': 1})
+		self.assertEqual(line, b'my\\ meas\\,ure=ment v=1i 1')
+
+	def test_tags(self):
+		line = self.encode(u'm', ((u'a key', u'x=1,y 2'),), {'v': 1})
+		self.assertEqual(line, b'm,a\\ key=x\\=1\\,y\\ 2 v=1i 1')
+
+	def test_tags_sorted_and_common(self):
+		line = self.encode(u'm', ((u'b', u'2'), (u'host', u'mine')), {'v': 1}, common=((u'host', u'pi'), (u'a', u'1')))
+		self.assertEqual(line, b'm,a=1,b=2,host=mine v=1i 1')
+
+	def test_empty_tag_values_dropped(self):
+		line = self.encode(u'm', ((u'a', u''), (u'b', None)), {'v': 1})
+		self.assertEqual(line, b'm v=1i 1')
+
+	def test_field_keys(self):
+		line = self.encode(u'm', (), {u'a b,c=d': 1})
+		self.assertEqual(line, b'm a\\ b\\,c\\=d=1i 1')
+
+	def test_strings(self):
+		self.assertEqual(encode_field_value(u'say "hi"\\'), u'"say \\"hi\\"\\\\"')
+		self.assertEqual(encode_field_value(u'two\nlines'), u'"two\\nlines"')
+		self.assertEqual(encode_field_value(b'bytes'), u'"bytes"')
+
+	def test_unicode(self):
+		line = self.encode(u'm', ((u't', u'caf\xe9'),), {'v': u'☃'})
+		self.assertEqual(line, u'm,t=caf\xe9 v="☃" 1'.encode('utf-8'))
+
+class FieldValueTest(unittest.TestCase):
+	def test_types(self):
+		self.assertEqual(encode_field_value(True), u'true')
+		self.assertEqual(encode_field_value(False), u'false')
+		self.assertEqual(encode_field_value(3), u'3i')
+		self.assertEqual(encode_field_value(1.5), u'1.5')
+		self.assertEqual(encode_field_value(2.0), u'2.0')
+
+	def test_unstorable(self):
+		self.assertIsNone(encode_field_value(float('nan')))
+		self.assertIsNone(encode_field_value(float('inf')))
+		self.assertIsNone(encode_field_value(None))
+		self.assertIsNone(encode_field_value([1]))
+
+	def test_no_fields(self):
+		encoder = LineEncoder('s')
+		self.assertIsNone(encoder.encode(u'm', (), {'a': None, 'b': float('nan')}, 1))
+
+class TimestampTest(unittest.TestCase):
+	def test_precisions(self):
+		self.assertEqual(LineEncoder('s').timestamp(1.5), 1)
+		self.assertEqual(LineEncoder('ms').timestamp(1.5), 1500)
+		self.assertEqual(LineEncoder('us').timestamp(1.5), 1500000)
+		self.assertEqual(LineEncoder('ns').timestamp(2), 2000000000)
+
+	def test_bad_precision(self):
+		self.assertEqual(LineEncoder('fortnights').precision, 'us')
+
+if __name__ == '__main__':
+	unittest.main()
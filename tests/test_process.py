@@ -0,0 +1,129 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import octoprint_influxdb
+import octoprint_influxdb.destination
+import octoprint_influxdb.metrics
+import octoprint_influxdb.process
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules neither side of the writer process should need to load
+HEAVY = ['flask', 'octoprint', 'octoprint.plugin', 'influxdb', 'influxdb_client']
+
+CHILD = '''
+import json, multiprocessing, sys
+import octoprint_influxdb_writer
+heavy, package_path, values, defaults, folder = json.loads(sys.argv[1])
+parent, child = multiprocessing.Pipe()
+parent.send_bytes(b'Q')
+octoprint_influxdb_writer.run(child, package_path, values, defaults, folder)
+print(json.dumps([m for m in heavy if m in sys.modules]))
+'''
+
+PARENT = '''
+import json, logging, sys
+import octoprint_influxdb.destination, octoprint_influxdb.metrics, octoprint_influxdb.process
+heavy, values, defaults = json.loads(sys.argv[1])
+process = octoprint_influxdb.process.WriterProcess(logging.getLogger(), octoprint_influxdb.metrics.PluginMetrics())
+settings = octoprint_influxdb.destination.StaticSettings(values)
+dest = octoprint_influxdb.process.RemoteDestination('default', settings, defaults, process)
+print(json.dumps([m for m in heavy if m in sys.modules]))
+'''
+
+def run_python(script, *args):
+	env = dict(os.environ, PYTHONPATH=ROOT)
+	out = subprocess.check_output([sys.executable, '-c', script, json.dumps(args)], cwd=ROOT, env=env)
+	return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+class RemoteDestinationTest(unittest.TestCase):
+	def setUp(self):
+		self.process = octoprint_influxdb.process.WriterProcess(logging.getLogger(__name__), octoprint_influxdb.metrics.PluginMetrics())
+		settings = octoprint_influxdb.destination.StaticSettings({})
+		self.dest = octoprint_influxdb.process.RemoteDestination('default', settings, {'api_version': 1, 'precision': 'us'}, self.process)
+
+	def test_accepts_points_before_first_report(self):
+		# the child hasn't started, or is restarting
+		self.assertEqual(self.process.status, {})
+		self.assertFalse(self.dest.connected())
+		self.assertTrue(self.dest.spooling())
+
+	def test_follows_child_reports(self):
+		self.process.receive(('status', {'default': (True, False)}, {}))
+		self.assertTrue(self.dest.connected())
+		self.assertFalse(self.dest.spooling())
+		self.process.receive(('status', {'default': (False, False)}, {}))
+		self.assertFalse(self.dest.connected())
+		self.assertFalse(self.dest.spooling())
+
+class WriterProcessTest(unittest.TestCase):
+	def make(self, **values):
+		process = octoprint_influxdb.process.WriterProcess(logging.getLogger(__name__), octoprint_influxdb.metrics.PluginMetrics())
+		process.configure(values, {'queue_size': 100}, None)
+		process.running = True
+		return process
+
+	def fill(self, process, n):
+		for i in range(n):
+			process.put({'us': i})
+		return [p['us'] for p in process.queue]
+
+	def test_drop_oldest(self):
+		process = self.make(queue_size=3)
+		self.assertEqual(self.fill(process, 5), [2, 3, 4])
+		self.assertEqual(process.dropped(), 2)
+
+	def test_drop_newest(self):
+		process = self.make(queue_size=3, queue_overflow='drop_newest')
+		self.assertEqual(self.fill(process, 5), [0, 1, 2])
+		self.assertEqual(process.dropped(), 2)
+
+	def test_block(self):
+		process = self.make(queue_size=2, queue_overflow='block')
+		process.alive = True
+		self.fill(process, 2)
+		putter = threading.Thread(target=process.put, args=({'us': 2},))
+		putter.start()
+		putter.join(0.2)
+		self.assertTrue(putter.is_alive())
+		with process.cond:
+			process.queue.popleft()
+			process.cond.notify_all()
+		putter.join(5)
+		self.assertFalse(putter.is_alive())
+		self.assertEqual([p['us'] for p in process.queue], [1, 2])
+		self.assertEqual(process.dropped(), 0)
+
+	def test_block_without_child(self):
+		# restarting a child can take a minute, so don't wait for it
+		process = self.make(queue_size=2, queue_overflow='block')
+		self.assertEqual(self.fill(process, 3), [1, 2])
+		self.assertEqual(process.dropped(), 1)
+
+class ImportTest(unittest.TestCase):
+	def setUp(self):
+		self.defaults = octoprint_influxdb.InfluxDBPlugin().get_settings_defaults()
+
+	def test_child_skips_plugin_package(self):
+		folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, folder)
+		values = dict(api_version='file', file_path=os.path.join(folder, 'lines'))
+		package_path = os.path.dirname(os.path.abspath(octoprint_influxdb.process.__file__))
+		self.assertEqual(run_python(CHILD, HEAVY, package_path, values, self.defaults, folder), [])
+
+	def test_parent_skips_client_library(self):
+		for values in [dict(api_version=1), dict(api_version=1, udp=True), dict(api_version=2)]:
+			self.assertEqual(run_python(PARENT, ['influxdb', 'influxdb_client'], values, self.defaults), [])
+
+if __name__ == '__main__':
+	unittest.main()
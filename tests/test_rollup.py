@@ -0,0 +1,68 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import octoprint_influxdb.destination
+import octoprint_influxdb.metrics
+
+DEFAULTS = dict(rollup_name='rollup', rollup_interval=60, rollup_retention=365)
+
+class FakeClient:
+	def __init__(self):
+		self.provisioned = []
+
+	def provision_rollups(self, dbname, spec):
+		self.provisioned.append((dbname, spec['interval']))
+		return True
+
+class ProvisionTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.folder)
+		self.values = dict(rollups=True)
+		self.dest = octoprint_influxdb.destination.InfluxDestination(
+			'test', octoprint_influxdb.destination.StaticSettings(self.values), DEFAULTS,
+			logging.getLogger(__name__), octoprint_influxdb.metrics.PluginMetrics(),
+			os.path.join(self.folder, 'spool.sqlite'),
+		)
+		self.client = FakeClient()
+
+	def provision(self, dbname='octoprint', url='http://a'):
+		self.dest.provision(self.client, FakeClient, dict(url=url), dbname)
+		provisioned = self.client.provisioned
+		self.client.provisioned = []
+		return provisioned
+
+	def test_only_when_changed(self):
+		self.assertEqual(self.provision(), [('octoprint', 60)])
+		self.assertEqual(self.provision(), [])
+		self.values['rollup_interval'] = 300
+		self.assertEqual(self.provision(), [('octoprint', 300)])
+		self.assertEqual(self.provision(), [])
+
+	def test_new_server_or_database(self):
+		self.provision()
+		self.assertEqual(self.provision(dbname='other'), [('other', 60)])
+		self.assertEqual(self.provision(url='http://b'), [('octoprint', 60)])
+		# and back again
+		self.assertEqual(self.provision(), [('octoprint', 60)])
+
+	def test_turned_off_and_on(self):
+		self.provision()
+		self.values['rollups'] = False
+		self.assertEqual(self.provision(), [])
+		self.values['rollups'] = True
+		self.assertEqual(self.provision(), [('octoprint', 60)])
+
+	def test_per_destination(self):
+		self.provision()
+		self.dest.name = 'other'
+		self.assertEqual(self.provision(), [('octoprint', 60)])
+
+if __name__ == '__main__':
+	unittest.main()
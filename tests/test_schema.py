@@ -0,0 +1,73 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import unittest
+
+from octoprint_influxdb import schema
+
+class CoerceTest(unittest.TestCase):
+	def test_float(self):
+		self.assertEqual(schema.to_float(3), 3.0)
+		self.assertEqual(schema.to_float(u'2.5'), 2.5)
+		self.assertIsNone(schema.to_float(u'warm'))
+		self.assertIsNone(schema.to_float(None))
+
+	def test_integer(self):
+		self.assertEqual(schema.to_integer(2.6), 3)
+		self.assertEqual(schema.to_integer(True), 1)
+		self.assertEqual(schema.to_integer(u'7'), 7)
+		self.assertIsNone(schema.to_integer(float('nan')))
+		self.assertIsNone(schema.to_integer(u'seven'))
+
+	def test_string(self):
+		self.assertEqual(schema.to_string(b'abc'), u'abc')
+		self.assertEqual(schema.to_string(True), u'true')
+		self.assertEqual(schema.to_string(5), u'5')
+		self.assertIsNone(schema.to_string({}))
+
+	def test_boolean(self):
+		self.assertIs(schema.to_boolean(u'Yes'), True)
+		self.assertIs(schema.to_boolean(u'nope'), False)
+		self.assertIs(schema.to_boolean(0), False)
+		self.assertIsNone(schema.to_boolean([]))
+
+class FieldSchemaTest(unittest.TestCase):
+	def test_declared(self):
+		fields = schema.FieldSchema().apply('progress', {'pct': 12.4, 'completion': 12, 'print_time_left_origin': 3})
+		self.assertEqual(fields, {'pct': 12, 'completion': 12.0, 'print_time_left_origin': u'3'})
+
+	def test_first_type_sticks(self):
+		s = schema.FieldSchema()
+		self.assertEqual(s.apply('m', {'state': u'on'}), {'state': u'on'})
+		self.assertEqual(s.apply('m', {'state': 1}), {'state': u'1'})
+		self.assertEqual(s.apply('m', {'flag': True}), {'flag': True})
+		self.assertEqual(s.apply('m', {'flag': u'off'}), {'flag': False})
+
+	def test_numbers_keep_their_type(self):
+		# existing databases already have integer fields like these
+		s = schema.FieldSchema()
+		self.assertEqual(s.apply('temperature', {'tool0_offset': 0, 'tool0_actual': 21.5}), {'tool0_offset': 0, 'tool0_actual': 21.5})
+		fields = s.apply('temperature', {'tool0_offset': 5.0, 'tool0_actual': 22})
+		self.assertEqual(fields, {'tool0_offset': 5, 'tool0_actual': 22.0})
+		self.assertIsInstance(fields['tool0_offset'], int)
+		self.assertIsInstance(fields['tool0_actual'], float)
+
+	def test_unusable_values_dropped(self):
+		s = schema.FieldSchema()
+		self.assertEqual(s.apply('m', {'a': None, 'b': [1, 2], 'c': u'x'}), {'c': u'x'})
+		# a value that can't become the learned type is left out
+		s.apply('m', {'d': 1.5})
+		self.assertEqual(s.apply('m', {'d': u'lots'}), {})
+
+	def test_rename(self):
+		s = schema.FieldSchema(rename={'time': 'time_'})
+		self.assertEqual(s.apply('m', {'time': u'now'}), {'time_': u'now'})
+
+	def test_declare_later(self):
+		s = schema.FieldSchema()
+		s.apply('m', {'n': 1.5})
+		s.declare('m', {'n': schema.STRING})
+		self.assertEqual(s.apply('m', {'n': 1.5}), {'n': u'1.5'})
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,88 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from octoprint_influxdb.spool import InfluxSpool, SpoolReplayer
+
+class SpoolTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.folder)
+		self.path = os.path.join(self.folder, 'spool.sqlite')
+
+	def open(self, max_size=1024 * 1024):
+		spool = InfluxSpool(self.path, max_size, logging.getLogger(__name__))
+		self.addCleanup(spool.close)
+		return spool
+
+	def test_cap_drops_oldest(self):
+		spool = self.open(max_size=50)
+		for i in range(10):
+			spool.append([u'point{:05d}'.format(i).encode('ascii')], 'us')
+		self.assertLessEqual(spool.size, 50)
+		self.assertEqual(spool.count + spool.dropped, 10)
+		lastid, precision, points = spool.peek(100)
+		self.assertEqual(points[-1], b'point00009')
+		self.assertEqual(points, sorted(points))
+
+	def test_peek_stops_at_precision_change(self):
+		spool = self.open()
+		spool.append([b'a', b'b'], 'us')
+		spool.append([b'c'], 'ms')
+		lastid, precision, points = spool.peek(10)
+		self.assertEqual((precision, points), ('us', [b'a', b'b']))
+		spool.discard(lastid)
+		self.assertEqual(spool.count, 1)
+		self.assertEqual(spool.peek(10)[1:], ('ms', [b'c']))
+
+	def test_survives_reopen(self):
+		spool = self.open()
+		spool.append([b'a', b'bb'], 'us')
+		spool.close()
+		spool = self.open()
+		self.assertEqual((spool.count, spool.size), (2, 3))
+
+	def test_replay_order(self):
+		spool = self.open()
+		spool.append([b'a', b'b'], 'us')
+		spool.append([b'c'], 'ms')
+		spool.append([b'd'], 'us')
+		written = []
+		def write(points, precision):
+			written.append((precision, points))
+			return True
+		replayer = SpoolReplayer(spool, write, logging.getLogger(__name__), rate=0, batch_size=1000)
+		replayer.start()
+		replayer.wake()
+		for _ in range(100):
+			if not spool.count:
+				break
+			replayer.stopped.wait(0.02)
+		replayer.stop(5)
+		self.assertEqual(written, [('us', [b'a', b'b']), ('ms', [b'c']), ('us', [b'd'])])
+
+	def test_replay_stops_on_failure(self):
+		spool = self.open()
+		spool.append([b'a'], 'us')
+		calls = []
+		def write(points, precision):
+			calls.append(points)
+			return False
+		replayer = SpoolReplayer(spool, write, logging.getLogger(__name__), rate=0)
+		replayer.start()
+		replayer.wake()
+		for _ in range(100):
+			if calls:
+				break
+			replayer.stopped.wait(0.02)
+		replayer.stop(5)
+		self.assertEqual(calls, [[b'a']])
+		self.assertEqual(spool.count, 1)
+
+if __name__ == '__main__':
+	unittest.main()
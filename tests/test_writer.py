@@ -0,0 +1,72 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+import unittest
+
+import octoprint_influxdb.writer
+
+class RecordingWrite:
+	def __init__(self):
+		self.batches = []
+		self.event = threading.Event()
+
+	def __call__(self, batch):
+		self.batches.append(batch)
+		self.event.set()
+
+class InfluxWriterTest(unittest.TestCase):
+	def make(self, start=True, **kwargs):
+		write = RecordingWrite()
+		writer = octoprint_influxdb.writer.InfluxWriter(write, logging.getLogger(__name__), **kwargs)
+		if start:
+			writer.start()
+			self.addCleanup(writer.stop, 5)
+		return writer, write
+
+	def test_flush_by_age(self):
+		# a lone point on an empty queue must not wait for a full batch
+		writer, write = self.make(batch_size=100, max_age=0.1)
+		start = time.time()
+		writer.put(b'a')
+		self.assertTrue(write.event.wait(2))
+		self.assertLess(time.time() - start, 1.0)
+		self.assertEqual(write.batches, [[b'a']])
+
+	def test_flush_by_size(self):
+		writer, write = self.make(batch_size=3, max_age=60)
+		for p in [b'a', b'b', b'c', b'd']:
+			writer.put(p)
+		self.assertTrue(write.event.wait(2))
+		self.assertEqual(write.batches[0], [b'a', b'b', b'c'])
+		# the leftover point waits for the batch age
+		time.sleep(0.1)
+		self.assertEqual(len(write.batches), 1)
+		self.assertEqual(writer.pending(), 1)
+
+	def test_stop_writes_everything(self):
+		writer, write = self.make(batch_size=2, max_age=60)
+		for p in [b'a', b'b', b'c']:
+			writer.put(p)
+		writer.stop(5)
+		self.assertEqual(sum(write.batches, []), [b'a', b'b', b'c'])
+
+	def test_drop_oldest(self):
+		# no worker, so the queue only fills up
+		writer, write = self.make(start=False, queue_size=2, batch_size=2, max_age=60)
+		for p in [b'a', b'b', b'c']:
+			writer.put(p)
+		self.assertEqual(list(writer.queue), [b'b', b'c'])
+		self.assertEqual(writer.dropped, 1)
+
+	def test_drop_newest(self):
+		writer, write = self.make(start=False, queue_size=2, batch_size=2, max_age=60, overflow=octoprint_influxdb.writer.OVERFLOW_DROP_NEWEST)
+		for p in [b'a', b'b', b'c']:
+			writer.put(p)
+		self.assertEqual(list(writer.queue), [b'a', b'b'])
+		self.assertEqual(writer.dropped, 1)
+
+if __name__ == '__main__':
+	unittest.main()